@@ -0,0 +1,9 @@
+"""Воспроизводимые замеры производительности без обращения к сайтам.
+
+python -m bench parsers   - разбор записанных страниц ЕФРСБ и Кад.арбитр (пустых, малых и больших);
+python -m bench pipeline  - сквозная обработка запросов бота: handle_message -> очередь -> воркер ->
+                            process_request, с заменой сервисов парсеров и Telegram.
+
+Оба замера выводят пропускную способность, перцентили задержки p50/p95/p99 и пиковую память;
+с --json результаты сохраняются для сравнения запусков.
+"""
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import logging
+
+from logging_setup import setup_logging
+
+from .bench_parsers import bench_parsers
+from .bench_pipeline import bench_pipeline
+from .fixtures import load_fixtures
+from .results import max_rss_mb, print_table, save_results
+
+
+def main():
+    """Запуск замеров производительности."""
+    setup_logging(level=logging.WARNING)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--fixtures", help="каталог с записанными страницами (заменяют синтетические)")
+    common.add_argument("--json", help="файл для сохранения результатов")
+    parser = argparse.ArgumentParser(description="Замеры производительности парсеров и бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parsers = commands.add_parser("parsers", parents=[common], help="разбор страниц результатов")
+    parsers.add_argument("--iterations", type=int, default=20, help="повторов разбора каждой страницы")
+
+    pipeline = commands.add_parser("pipeline", parents=[common], help="сквозная обработка запросов бота")
+    pipeline.add_argument("--requests", type=int, default=100, help="число запросов")
+    pipeline.add_argument("--users", type=int, default=10, help="число пользователей")
+    pipeline.add_argument("--unique", type=int, default=0, help="различных ИНН (по умолчанию все разные)")
+    pipeline.add_argument("--workers", type=int, default=3, help="воркеров бота")
+    pipeline.add_argument("--rate", type=float, default=0, help="запросов в секунду, 0 - все сразу")
+    pipeline.add_argument("--latency", type=float, default=0.5, help="задержка ответа сервиса, с")
+    pipeline.add_argument("--page-latency", type=float, default=0.2, help="задержка каждой следующей страницы дел, с")
+    pipeline.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержкам, с")
+    pipeline.add_argument("--telegram-latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    pipeline.add_argument("--mix", default="empty:1,small:2,large:1", help="доли размеров ответов")
+    pipeline.add_argument("--parse", action="store_true", help="разбирать страницу при каждом запросе")
+    pipeline.add_argument("--trace-memory", action="store_true",
+                          help="пиковая память по tracemalloc вместо RSS (замедляет замер)")
+    pipeline.add_argument("--timeout", type=float, default=600, help="предельное время замера, с")
+    pipeline.add_argument("--log-level", default="WARNING", help="уровень логов бота во время замера")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if args.command == "parsers":
+        results = bench_parsers(fixtures, args.iterations)
+    else:
+        results = asyncio.run(bench_pipeline(fixtures, args))
+    print_table(results)
+    print(f"Пиковый RSS процесса: {max_rss_mb():.1f} МБ")
+    if args.json:
+        save_results(args.json, results, vars(args))
+
+
+if __name__ == '__main__':
+    main()
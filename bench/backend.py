@@ -0,0 +1,102 @@
+import asyncio
+import random
+from aiohttp import web
+
+from parsers.extract import extract_efrsb, extract_kad_cases, run_extraction
+from parsers.kad_arbitr_parser import PAGE_SIZE
+from parsers.models import dumps
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def parse_mix(value: str) -> list:
+    """Доли размеров ответов, например "empty:1,small:2,large:1" -> порядок выбора страниц по ИНН."""
+    cycle = []
+    for part in value.split(","):
+        size, _, weight = part.partition(":")
+        cycle.extend([size.strip()] * int(weight or 1))
+    return cycle
+
+
+class Backend:
+    """Замена сервисов парсеров (service.py): отдает записанные страницы с заданной задержкой.
+
+    Ответы строятся из тех же страниц, что разбираются в замере парсеров, и повторяют
+    протокол сервисов: POST /efrsb и POST /kad_arbitr (в том числе потоковый NDJSON).
+    Задержка имитирует работу браузера и сайта; при parse=True каждая страница
+    еще и разбирается заново в пуле процессов, как в настоящем сервисе.
+    """
+
+    def __init__(self, fixtures: dict, mix: list, latency: float = 0.5, page_latency: float = 0.2,
+                 jitter: float = 0.0, parse: bool = False, seed: int = 1):
+        self.fixtures = fixtures
+        self.mix = mix
+        self.latency = latency
+        self.page_latency = page_latency
+        self.jitter = jitter
+        self.parse = parse
+        self._random = random.Random(seed)
+        self._parsed = {}
+        self.requests = 0
+
+    def _size(self, inn: str) -> str:
+        return self.mix[int(inn) % len(self.mix)]
+
+    async def _sleep(self, seconds: float):
+        if self.jitter:
+            seconds += self._random.uniform(0, self.jitter)
+        await asyncio.sleep(seconds)
+
+    async def _extract(self, name: str, extract):
+        if self.parse:
+            return await run_extraction(extract, self.fixtures[name])
+        if name not in self._parsed:
+            self._parsed[name] = extract(self.fixtures[name])
+        return self._parsed[name]
+
+    async def efrsb(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        await self._sleep(self.latency)
+        result = await self._extract(f"efrsb_{self._size(body['inn'])}", extract_efrsb)
+        return web.Response(body=dumps({"status": "success", **result}), content_type="application/json")
+
+    async def kad_arbitr(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        await self._sleep(self.latency)
+        result = await self._extract(f"kad_{self._size(body['inn'])}", extract_kad_cases)
+        cases = (result["cases"] or [])[:body.get("max_cases", len(result["cases"] or []))]
+        if not body.get("stream"):
+            return web.Response(body=dumps({"status": "success", "data": {"cases": cases}}),
+                                content_type="application/json")
+
+        response = web.StreamResponse(headers={"Content-Type": f"{NDJSON_CONTENT_TYPE}; charset=utf-8"})
+        await response.prepare(request)
+        pages = (len(cases) + PAGE_SIZE - 1) // PAGE_SIZE
+        pages = min(pages, body.get("max_pages", pages))
+        for page in range(pages):
+            if page:
+                await self._sleep(self.page_latency)
+            event = {"status": "partial", "cases": cases[page * PAGE_SIZE:(page + 1) * PAGE_SIZE],
+                     "page": page + 1, "pages": pages}
+            await response.write(dumps(event) + b"\n")
+        total = min(len(cases), pages * PAGE_SIZE)
+        await response.write(dumps({"status": "success", "total": total}) + b"\n")
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/efrsb", self.efrsb)
+        app.router.add_post("/kad_arbitr", self.kad_arbitr)
+        return app
+
+
+async def start_backend(backend: Backend, host: str = "127.0.0.1"):
+    """Запуск сервера на свободном порту: (runner, базовый URL)."""
+    runner = web.AppRunner(backend.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, 0).start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
@@ -0,0 +1,36 @@
+import time
+
+from parsers.extract import HTML_BACKEND, extract_efrsb, extract_kad_cases, extract_kad_fragment
+
+from .results import summarize, trace_memory
+
+EXTRACTORS = {"efrsb": extract_efrsb, "kad": extract_kad_cases, "kad_fragment": extract_kad_fragment}
+
+
+def extractor_for(name: str):
+    """Функция разбора для страницы по префиксу имени (efrsb_..., kad_..., kad_fragment_...)."""
+    prefix = "kad_fragment" if name.startswith("kad_fragment") else name.split("_")[0]
+    return EXTRACTORS[prefix]
+
+
+def bench_parsers(fixtures: dict, iterations: int) -> list:
+    """Разбор каждой страницы iterations раз в текущем процессе (без пула процессов)."""
+    results = []
+    for name, html in fixtures.items():
+        extract = extractor_for(name)
+        extract(html)  # прогрев
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call_start = time.perf_counter()
+            extract(html)
+            latencies.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+        # Память - отдельным разбором: отслеживание выделений искажает время
+        with trace_memory() as peak:
+            extract(html)
+        results.append(summarize(
+            f"parse {name}", latencies, elapsed, peak["bytes"],
+            html_kb=len(html.encode("utf-8")) // 1024, backend=HTML_BACKEND
+        ))
+    return results
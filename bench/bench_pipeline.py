@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import logging
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+
+from parsers import shutdown_extraction_pool
+
+from .backend import Backend, parse_mix, start_backend
+from .fake_telegram import FakeBot, fake_update
+from .results import max_rss_mb, summarize, trace_memory
+
+
+def configure_bot(directory: str, backend_url: str, args):
+    """Настройки бота для замера: отдельные базы, адреса замены сервисов, без сервера метрик.
+
+    Модуль main читает настройки при импорте, поэтому он импортируется после этого вызова.
+    """
+    os.environ.update({
+        "QUEUE_PATH": os.path.join(directory, "queue.sqlite3"),
+        "CACHE_PATH": os.path.join(directory, "cache.sqlite3"),
+        "HISTORY_PATH": os.path.join(directory, "history.sqlite3"),
+        "EFRSB_URL": f"{backend_url}/efrsb",
+        "KAD_ARBITR_URL": f"{backend_url}/kad_arbitr",
+        "WORKERS_COUNT": str(args.workers),
+        "MAX_QUEUE_SIZE": "0",
+        "MAX_QUEUE_WAIT": str(10 ** 6),
+        "MAX_USER_QUEUE": str(args.requests),
+        "JOB_MAX_ATTEMPTS": "1",
+        "METRICS_PORT": "0",
+    })
+
+
+def request_inns(count: int, unique: int) -> list:
+    """ИНН запросов: unique различных значений по кругу (повторы попадают в кэш или в ту же задачу)."""
+    return [str(7700000000 + i % unique) for i in range(count)]
+
+
+async def submit(main, bot: FakeBot, inns: list, users: int, rate: float) -> dict:
+    """Отправка запросов через handle_message: chat_id -> (время отправки, ожидание отчета)."""
+    pending = {}
+    for i, inn in enumerate(inns):
+        chat_id = i + 1
+        done = bot.expect(chat_id)
+        pending[chat_id] = (time.perf_counter(), done)
+        await main.handle_message(fake_update(bot, i % users + 1, chat_id, inn), None)
+        if rate:
+            await asyncio.sleep(1 / rate)
+    return pending
+
+
+async def bench_pipeline(fixtures: dict, args) -> list:
+    """Сквозной замер: handle_message -> очередь -> воркер -> process_request -> отчет в Telegram."""
+    mix = parse_mix(args.mix)
+    backend = Backend(fixtures, mix, latency=args.latency, page_latency=args.page_latency,
+                      jitter=args.jitter, parse=args.parse)
+    runner, backend_url = await start_backend(backend)
+    with tempfile.TemporaryDirectory() as directory:
+        configure_bot(directory, backend_url, args)
+        main = importlib.import_module("main")
+        logging.getLogger().setLevel(args.log_level)
+        bot = FakeBot(latency=args.telegram_latency)
+        inns = request_inns(args.requests, args.unique or args.requests)
+        await main.start_workers(bot)
+        try:
+            # Отслеживание выделений замедляет код в разы, поэтому по умолчанию берется пиковый RSS
+            with trace_memory() if args.trace_memory else nullcontext({"bytes": 0}) as peak:
+                start = time.perf_counter()
+                pending = await submit(main, bot, inns, args.users, args.rate)
+                await asyncio.wait_for(
+                    asyncio.gather(*(done for _, done in pending.values())), args.timeout
+                )
+                elapsed = time.perf_counter() - start
+        finally:
+            await main.stop_workers()
+            await runner.cleanup()
+            shutdown_extraction_pool()
+
+    latencies = {chat_id: done.result() - started for chat_id, (started, done) in pending.items()}
+    peak_bytes = peak["bytes"] if args.trace_memory else max_rss_mb() * 1024 * 1024
+    extra = {
+        "failed": len(bot.failed),
+        "telegram_sends": bot.sent,
+        "telegram_edits": bot.edited,
+        "backend_requests": backend.requests,
+    }
+    results = [summarize("pipeline all", list(latencies.values()), elapsed, peak_bytes, **extra)]
+    # Разбивка по размеру ответа: задержка больших отчетов растет с числом сообщений
+    for size in dict.fromkeys(mix):
+        sized = [latency for (chat_id, latency), inn in zip(latencies.items(), inns)
+                 if mix[int(inn) % len(mix)] == size and chat_id not in bot.failed]
+        if sized:
+            results.append(summarize(f"pipeline {size}", sized, elapsed, peak_bytes))
+    return results
+
@@ -0,0 +1,84 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+from report import closing_block
+
+# Начало текстов, которыми бот завершает запрос без отчета: ошибка задачи (main.run_job)
+# и отказ в постановке в очередь (main.handle_message)
+FAILURE_PREFIXES = ("Произошла ошибка", "Очередь переполнена")
+
+
+class FakeMessage:
+    """Сообщение Telegram с методами, которые использует бот: reply_text и edit_text."""
+
+    def __init__(self, bot: "FakeBot", chat_id: int, message_id: int, text: str = ""):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+
+    async def reply_text(self, text: str):
+        return await self.bot.send_message(self.chat_id, text)
+
+    async def edit_text(self, text: str):
+        await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+
+
+class FakeBot:
+    """Bot API без сети: считает отправленные сообщения и отмечает завершенные отчеты.
+
+    Отчет считается завершенным, когда сообщение в чате заканчивается закрывающим
+    блоком отчета или начинается с текста ошибки или отказа. latency имитирует время ответа Bot API.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+        self.edited = 0
+        self.done = {}
+        self.failed = set()
+        self._ids = itertools.count(1)
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        """Ожидание завершения отчета в чате: результат - время завершения (perf_counter)."""
+        self.done[chat_id] = asyncio.get_running_loop().create_future()
+        return self.done[chat_id]
+
+    def incoming(self, chat_id: int, text: str) -> FakeMessage:
+        """Сообщение пользователя в чат."""
+        return FakeMessage(self, chat_id, next(self._ids), text)
+
+    def _check_done(self, chat_id: int, text: str):
+        future = self.done.get(chat_id)
+        if future is None or future.done():
+            return
+        if text.startswith(FAILURE_PREFIXES):
+            self.failed.add(chat_id)
+            future.set_result(time.perf_counter())
+        elif text.endswith(closing_block()):
+            future.set_result(time.perf_counter())
+
+    async def send_message(self, chat_id: int, text: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = FakeMessage(self, chat_id, next(self._ids), text)
+        self.sent += 1
+        self._check_done(chat_id, text)
+        return message
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.edited += 1
+        self._check_done(chat_id, text)
+
+
+def fake_update(bot: FakeBot, user_id: int, chat_id: int, text: str):
+    """Update с текстовым сообщением пользователя, как его передает python-telegram-bot."""
+    return SimpleNamespace(
+        message=bot.incoming(chat_id, text),
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
@@ -0,0 +1,156 @@
+import argparse
+import os
+
+# Размеры выборок: пустой ответ, несколько записей и сотни карточек/строк
+SIZES = {"empty": 0, "small": 3, "large": 300}
+KAD_SIZES = {"empty": 0, "small": 7, "large": 300}
+# Строк в ответе эндпоинта поиска Кад.арбитр (одна страница результатов)
+KAD_FRAGMENT_ROWS = 25
+
+STATUSES = (
+    "Конкурсное производство",
+    "Наблюдение",
+    "Реализация имущества гражданина",
+    "Реструктуризация долгов гражданина",
+    "Производство прекращено",
+)
+COURTS = ("АС города Москвы", "АС Московской области", "АС города Санкт-Петербурга и Ленинградской области")
+
+
+def _page_chrome(title: str) -> tuple:
+    """Обвязка страницы (меню, скрипты), которую парсер должен пропустить: (начало, конец)."""
+    menu = "".join(
+        f'<li class="b-menu__item"><a href="/section/{i}" class="b-menu__link">Раздел {i}</a></li>' for i in range(400)
+    )
+    script = "".join(f"window.__state_{i} = {{id: {i}, flags: [1, 2, 3], name: 'item-{i}'}};\n" for i in range(800))
+    head = (
+        f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>{title}</title>'
+        f'<script>{script}</script></head><body><header><ul class="b-menu">{menu}</ul></header><main>'
+    )
+    tail = f'</main><footer><ul class="b-menu">{menu}</ul></footer></body></html>'
+    return head, tail
+
+
+def _efrsb_card(i: int) -> str:
+    legal_entity = i % 3 == 0
+    if legal_entity:
+        name = f'ООО "Ромашка-{i}"'
+        ids = (
+            f'<span class="u-card-result__point">ИНН</span><span class="u-card-result__value">77{i:08d}</span>'
+            f'<span class="u-card-result__point">ОГРН</span><span class="u-card-result__value">1027700{i:06d}</span>'
+        )
+    else:
+        name = f"Иванов{i} Иван Петрович"
+        ids = (
+            f'<span class="u-card-result__point">ИНН</span><span class="u-card-result__value">7701{i:08d}</span>'
+            f'<span class="u-card-result__point">СНИЛС</span>'
+            f'<span class="u-card-result__value">{i % 1000:03d}-456-789 {i % 100:02d}</span>'
+        )
+    return (
+        '<div class="u-card-result">'
+        f'<div class="u-card-result__name">{name}</div>'
+        f'<div class="u-card-result__value u-card-result__value_adr">г. Москва, ул. Тверская, д. {i % 50 + 1}</div>'
+        f'{ids}'
+        f'<div class="u-card-result__value u-card-result__value_item-property">{STATUSES[i % len(STATUSES)]}</div>'
+        f'<div class="status-date">{i % 28 + 1:02d}.{i % 12 + 1:02d}.2024</div>'
+        f'<div class="u-card-result__court-case"><div class="u-card-result__value">А40-{1000 + i}/2024</div></div>'
+        f'<div class="u-card-result__manager"><div class="u-card-result__value">Петров{i} Петр Сергеевич</div></div>'
+        '</div>'
+    )
+
+
+def efrsb_page(count: int) -> str:
+    """Страница результатов поиска ЕФРСБ с count карточками."""
+    head, tail = _page_chrome("Банкроты - ЕФРСБ")
+    if not count:
+        body = '<div class="no-result-msg"><div class="no-result-msg__header">Ничего не найдено</div></div>'
+    else:
+        body = '<div class="u-card-results">' + "".join(_efrsb_card(i) for i in range(count)) + '</div>'
+    return head + body + tail
+
+
+def _kad_row(i: int) -> str:
+    return (
+        '<tr>'
+        f'<td class="num"><div class="bankruptcy"><span>{i % 28 + 1:02d}.{i % 12 + 1:02d}.2024</span></div>'
+        f'<a class="num_case" href="https://kad.arbitr.ru/Card/{i:08x}" target="_blank">А40-{2000 + i}/2024</a></td>'
+        f'<td class="court"><div class="judge">Судья {i % 40} А. А.</div><div>{COURTS[i % len(COURTS)]}</div></td>'
+        f'<td class="plaintiff"><div class="b-container"><span class="js-rollover b-newRollover">'
+        f'<strong>ООО "Истец-{i}"</strong></span><span class="js-rolloverHtml">ИНН: '
+        f'<span class="g-highlight">77{i:08d}</span></span></div></td>'
+        f'<td class="respondent"><div class="b-container"><span class="js-rollover b-newRollover">'
+        f'<strong>ООО "Ответчик-{i}"</strong></span></div></td>'
+        '</tr>'
+    )
+
+
+def _kad_counters(count: int) -> str:
+    pages = (count + KAD_FRAGMENT_ROWS - 1) // KAD_FRAGMENT_ROWS
+    return (
+        f'<input type="hidden" id="documentsTotalCount" value="{count}" />'
+        f'<input type="hidden" id="documentsPagesCount" value="{pages}" />'
+    )
+
+
+def kad_page(count: int) -> str:
+    """Страница kad.arbitr.ru после поиска с count строками в таблице результатов."""
+    head, tail = _page_chrome("Картотека арбитражных дел")
+    hidden = " g-hidden" if count else ""
+    body = (
+        f'<div class="b-noResults{hidden}">Не найдено ни одного дела</div>'
+        '<div class="b-cases_wrapper"><table id="b-cases"><thead><tr><th>Дело</th><th>Суд</th>'
+        '<th>Истец</th><th>Ответчик</th></tr></thead><tbody>'
+        + "".join(_kad_row(i) for i in range(count))
+        + '</tbody></table></div>' + _kad_counters(count)
+    )
+    return head + body + tail
+
+
+def kad_fragment(count: int) -> str:
+    """Ответ эндпоинта поиска Кад.арбитр: строки таблицы и счетчики документов."""
+    return "".join(_kad_row(i) for i in range(count)) + _kad_counters(count)
+
+
+def build_fixtures() -> dict:
+    """Синтетический набор страниц: имя -> HTML. Разметка повторяет ту, что разбирают парсеры."""
+    fixtures = {}
+    for size, count in SIZES.items():
+        fixtures[f"efrsb_{size}"] = efrsb_page(count)
+    for size, count in KAD_SIZES.items():
+        fixtures[f"kad_{size}"] = kad_page(count)
+    fixtures["kad_fragment_empty"] = kad_fragment(0)
+    fixtures["kad_fragment_page"] = kad_fragment(KAD_FRAGMENT_ROWS)
+    return fixtures
+
+
+def load_fixtures(directory: str = None) -> dict:
+    """Набор страниц для замеров.
+
+    Страницы из каталога directory (например, сохраненные парсерами с PARSER_DEBUG_DIR
+    и переименованные в efrsb_large.html, kad_small.html и т. п.) заменяют синтетические
+    с тем же именем, поэтому замеры можно повторять на записанных ответах сайтов.
+    """
+    fixtures = build_fixtures()
+    if directory:
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            name, ext = os.path.splitext(entry.name)
+            if ext == ".html" and name.split("_")[0] in ("efrsb", "kad"):
+                with open(entry.path, encoding="utf-8") as f:
+                    fixtures[name] = f.read()
+    return fixtures
+
+
+def main():
+    """Сохранение синтетического набора страниц в каталог."""
+    parser = argparse.ArgumentParser(description="Сохранение страниц для замеров производительности")
+    parser.add_argument("directory", help="каталог для HTML-файлов")
+    args = parser.parse_args()
+    os.makedirs(args.directory, exist_ok=True)
+    for name, html in build_fixtures().items():
+        with open(os.path.join(args.directory, f"{name}.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        print(f"{name}.html: {len(html.encode('utf-8')) // 1024} КБ")
+
+
+if __name__ == '__main__':
+    main()
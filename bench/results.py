@@ -0,0 +1,65 @@
+import json
+import math
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(name: str, latencies: list, elapsed: float, peak_bytes: int, **extra) -> dict:
+    """Итог замера: пропускная способность, перцентили задержки (мс) и пиковая память (МБ)."""
+    return {
+        "name": name,
+        "count": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "peak_mb": peak_bytes / 1024 / 1024,
+        **extra,
+    }
+
+
+@contextmanager
+def trace_memory():
+    """Пиковый объем памяти, выделенной Python внутри блока: peak["bytes"] после выхода."""
+    peak = {"bytes": 0}
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield peak
+    finally:
+        peak["bytes"] = tracemalloc.get_traced_memory()[1]
+        if started:
+            tracemalloc.stop()
+
+
+def max_rss_mb() -> float:
+    """Пиковый размер резидентной памяти процесса (Linux: ru_maxrss в КБ)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def print_table(results: list):
+    print(f"{'замер':<28}{'кол-во':>8}{'в сек':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'память, МБ':>12}")
+    for result in results:
+        print(
+            f"{result['name']:<28}{result['count']:>8}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['peak_mb']:>12.1f}"
+        )
+
+
+def save_results(path: str, results: list, settings: dict):
+    """Сохранение результатов в JSON для сравнения запусков."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "results": results, "max_rss_mb": max_rss_mb()}, f,
+                  ensure_ascii=False, indent=2)
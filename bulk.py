@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+import aiohttp
+
+from logging_setup import REQUEST_ID_HEADER, request_id, setup_logging
+from parsers.models import loads
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Вывод сводки в XLSX доступен, если установлен openpyxl
+XLSX_AVAILABLE = openpyxl is not None
+
+logger = logging.getLogger(__name__)
+
+EFRSB_URL = os.getenv('EFRSB_URL', "http://localhost:5001/efrsb")
+KAD_ARBITR_URL = os.getenv('KAD_ARBITR_URL', "http://localhost:5002/kad_arbitr")
+
+# ИНН отправляются сервисам пакетами; одновременно выполняется не более BULK_PARALLEL_CHUNKS пакетов,
+# а общий темп ограничен BULK_RATE_PER_MINUTE ИНН в минуту, чтобы не нарваться на блокировку сайтов
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 20))
+BULK_PARALLEL_CHUNKS = int(os.getenv('BULK_PARALLEL_CHUNKS', 2))
+BULK_RATE_PER_MINUTE = int(os.getenv('BULK_RATE_PER_MINUTE', 60))
+# Для сводки достаточно первых страниц дел Кад.арбитр
+BULK_KAD_MAX_PAGES = int(os.getenv('BULK_KAD_MAX_PAGES', 4))
+BULK_KAD_MAX_CASES = int(os.getenv('BULK_KAD_MAX_CASES', 100))
+# Ожидание очередной строки пакетного ответа: ИНН пакета ждут свободную вкладку браузера
+BULK_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=3, sock_read=int(os.getenv('BULK_READ_TIMEOUT', 300)))
+BULK_MAX_INNS = int(os.getenv('BULK_MAX_INNS', 1000))
+
+SUMMARY_COLUMNS = [
+    "ИНН",
+    "ЕФРСБ: записей",
+    "ЕФРСБ: статусы",
+    "ЕФРСБ: дела о банкротстве",
+    "Кад.арбитр: дел",
+    "Кад.арбитр: номера дел",
+    "Ошибки",
+]
+
+INN_WEIGHTS_10 = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN_WEIGHTS_11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN_WEIGHTS_12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+
+def _control_digit(digits: list, weights: tuple) -> int:
+    return sum(digit * weight for digit, weight in zip(digits, weights)) % 11 % 10
+
+
+def is_valid_inn(inn: str) -> bool:
+    """Проверка ИНН по длине и контрольным цифрам."""
+    if not inn.isdigit() or len(inn) not in (10, 12):
+        return False
+    digits = [int(c) for c in inn]
+    if len(inn) == 10:
+        return digits[9] == _control_digit(digits, INN_WEIGHTS_10)
+    return digits[10] == _control_digit(digits, INN_WEIGHTS_11) and digits[11] == _control_digit(digits, INN_WEIGHTS_12)
+
+
+def parse_inns(text: str) -> tuple:
+    """ИНН из текста или CSV: (корректные без повторов, некорректные).
+
+    Значения разделяются пробелами, запятыми, точками с запятой или переводами строк;
+    нечисловые значения (заголовки, названия) пропускаются.
+    """
+    valid, invalid = {}, {}
+    for token in re.split(r'[\s,;]+', text):
+        token = token.strip('"\'')
+        if not token.isdigit():
+            continue
+        (valid if is_valid_inn(token) else invalid)[token] = None
+    return list(valid), list(invalid)
+
+
+def decode_upload(data: bytes) -> str:
+    """Текст загруженного файла: UTF-8 (в том числе с BOM) или Windows-1251 из Excel."""
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1251", errors="replace")
+
+
+class BulkOutputError(Exception):
+    """Файл сводки записан по другому списку ИНН или неизвестно по какому."""
+
+
+def inns_digest(inns: list) -> str:
+    """Отпечаток списка ИНН: по нему сводка связывается со списком, из которого построена."""
+    return hashlib.sha1(",".join(inns).encode()).hexdigest()[:12]
+
+
+def run_marker_path(csv_path: str) -> str:
+    """Файл-метка сводки: отпечаток списка ИНН и признак завершения проверки."""
+    return f"{csv_path}.run"
+
+
+def read_run_marker(csv_path: str):
+    """(отпечаток списка ИНН, проверка завершена) по метке сводки или None, если метки нет."""
+    try:
+        with open(run_marker_path(csv_path), encoding="utf-8") as f:
+            digest, _, state = f.read().strip().partition(" ")
+    except FileNotFoundError:
+        return None
+    return digest, state == "finished"
+
+
+def write_run_marker(csv_path: str, digest: str, finished: bool):
+    with open(run_marker_path(csv_path), "w", encoding="utf-8") as f:
+        f.write(f"{digest} {'finished' if finished else 'running'}\n")
+
+
+def remove_bulk_files(*paths: str):
+    """Удаление сводки и ее метки после отправки пользователю."""
+    for path in paths:
+        for candidate in (path, run_marker_path(path)):
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+
+
+def load_checkpoint(csv_path: str) -> set:
+    """ИНН, успешно проверенные прошлым (возможно, прерванным) запуском.
+
+    Строки с ошибками удаляются из сводки, чтобы эти ИНН проверились заново.
+    """
+    if not os.path.exists(csv_path):
+        return set()
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.reader(f) if len(row) == len(SUMMARY_COLUMNS)]
+    completed = [row for row in rows[1:] if not row[-1]]
+    if len(completed) != len(rows) - 1:
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([SUMMARY_COLUMNS] + completed)
+    return {row[0] for row in completed}
+
+
+def summary_row(inn: str, efrsb: dict, kad: dict) -> list:
+    """Строка сводки по ответам обоих сервисов."""
+    errors = []
+    records = efrsb.get("individuals", []) + efrsb.get("legal_entities", [])
+    if efrsb.get("status") != "success":
+        errors.append(f"ЕФРСБ: {efrsb.get('error', 'Неизвестная ошибка')}")
+    cases = kad.get("data", {}).get("cases", [])
+    if kad.get("status") != "success":
+        errors.append(f"Кад.арбитр: {kad.get('error', 'Неизвестная ошибка')}")
+    elif kad["data"].get("incomplete"):
+        errors.append(f"Кад.арбитр (неполные данные): {kad['data']['incomplete']}")
+    return [
+        inn,
+        len(records) if efrsb.get("status") == "success" else "",
+        "; ".join(record.get("status", "") for record in records),
+        "; ".join(record.get("court_case_number", "") for record in records if record.get("court_case_number")),
+        len(cases) if kad.get("status") == "success" else "",
+        "; ".join(case.get("case_number", "") for case in cases),
+        "; ".join(errors),
+    ]
+
+
+async def fetch_batch(session: aiohttp.ClientSession, url: str, payload: dict):
+    """Результаты пакетного запроса к сервису (NDJSON) по мере готовности: (ИНН, результат).
+
+    При ошибке соединения для ИНН, по которым ответ не получен, возвращается ошибка.
+    """
+    pending = set(payload["inns"])
+    try:
+        headers = {REQUEST_ID_HEADER: request_id.get()}
+        async with session.post(url, json=payload, headers=headers, timeout=BULK_TIMEOUT) as response:
+            if response.status != 200:
+                logger.error("Ошибка HTTP %s при пакетном запросе к %s", response.status, url)
+                error = {"status": "error", "error": f"HTTP {response.status}"}
+            else:
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    result = loads(line)
+                    inn = result.pop("inn")
+                    pending.discard(inn)
+                    yield inn, result
+                error = {"status": "error", "error": "Поток данных прерван"}
+    except aiohttp.ClientError as e:
+        logger.error("Ошибка при пакетном запросе к %s: %s", url, e)
+        error = {"status": "error", "error": f"Ошибка сети: {str(e)}"}
+    except asyncio.TimeoutError:
+        logger.error("Тайм-аут при пакетном запросе к %s", url)
+        error = {"status": "error", "error": "Тайм-аут запроса"}
+    for inn in payload["inns"]:
+        if inn in pending:
+            yield inn, error
+
+
+class BulkRun:
+    """Массовая проверка ИНН с записью сводки в CSV по мере получения результатов.
+
+    CSV служит контрольной точкой: пока проверка не завершена (метка <csv>.run
+    в состоянии running), повторный запуск с тем же списком ИНН пропускает
+    успешно проверенные ИНН, а ИНН с ошибками проверяет заново. Завершенная
+    сводка того же списка при новом запуске перезаписывается. Сводка другого
+    (или неизвестного) списка перезаписывается только при overwrite=True,
+    иначе - BulkOutputError.
+    before_chunk - корутина, которую пакет ждет перед запуском (например, чтобы
+    уступить сервисы одиночным запросам пользователей бота).
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, inns: list, csv_path: str,
+                 efrsb_url: str = EFRSB_URL, kad_arbitr_url: str = KAD_ARBITR_URL, on_progress=None,
+                 before_chunk=None, overwrite: bool = False):
+        self.session = session
+        self.inns = inns
+        self.csv_path = csv_path
+        self.efrsb_url = efrsb_url
+        self.kad_arbitr_url = kad_arbitr_url
+        self.on_progress = on_progress
+        self.before_chunk = before_chunk
+        self.overwrite = overwrite
+        self.digest = inns_digest(inns)
+        self.done = 0
+        self.errors = 0
+        self._partial = {}
+        self._file = None
+        self._writer = None
+        self._next_start = 0.0
+        self._rate_lock = asyncio.Lock()
+        self._chunks = asyncio.Semaphore(BULK_PARALLEL_CHUNKS)
+
+    @property
+    def total(self) -> int:
+        return len(self.inns)
+
+    def _checkpoint(self) -> set:
+        """ИНН, готовые после прерванного запуска с тем же списком; иначе сводка начинается заново."""
+        marker = read_run_marker(self.csv_path)
+        exists = os.path.exists(self.csv_path) and os.path.getsize(self.csv_path) > 0
+        if marker == (self.digest, False):
+            return load_checkpoint(self.csv_path)
+        if exists and (marker is None or marker[0] != self.digest) and not self.overwrite:
+            raise BulkOutputError(f"Файл {self.csv_path} содержит сводку по другому списку ИНН")
+        if exists:
+            os.remove(self.csv_path)
+        return set()
+
+    async def run(self) -> dict:
+        completed = self._checkpoint()
+        write_run_marker(self.csv_path, self.digest, finished=False)
+        pending = [inn for inn in self.inns if inn not in completed]
+        self.done = self.total - len(pending)
+        if self.done:
+            logger.info("Возобновление массовой проверки %s: уже готово %s из %s",
+                        self.csv_path, self.done, self.total)
+        new_file = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+        with open(self.csv_path, "a", newline="", encoding="utf-8") as f:
+            self._file, self._writer = f, csv.writer(f)
+            if new_file:
+                self._writer.writerow(SUMMARY_COLUMNS)
+            chunks = [pending[i:i + BULK_CHUNK_SIZE] for i in range(0, len(pending), BULK_CHUNK_SIZE)]
+            await asyncio.gather(*(self._run_chunk(chunk) for chunk in chunks))
+        write_run_marker(self.csv_path, self.digest, finished=True)
+        return {"total": self.total, "done": self.done, "errors": self.errors}
+
+    async def _wait_rate(self, count: int):
+        """Ограничение темпа: пакет из count ИНН стартует не раньше, чем позволяет BULK_RATE_PER_MINUTE."""
+        async with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + count * 60 / BULK_RATE_PER_MINUTE
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _run_chunk(self, chunk: list):
+        async with self._chunks:
+            if self.before_chunk is not None:
+                await self.before_chunk()
+            await self._wait_rate(len(chunk))
+            kad_payload = {"inns": chunk, "max_pages": BULK_KAD_MAX_PAGES, "max_cases": BULK_KAD_MAX_CASES}
+            await asyncio.gather(
+                self._consume("efrsb", fetch_batch(self.session, self.efrsb_url, {"inns": chunk})),
+                self._consume("kad_arbitr", fetch_batch(self.session, self.kad_arbitr_url, kad_payload)),
+            )
+
+    async def _consume(self, source: str, results):
+        async for inn, result in results:
+            partial = self._partial.setdefault(inn, {})
+            partial[source] = result
+            if len(partial) == 2:
+                del self._partial[inn]
+                await self._write(inn, partial["efrsb"], partial["kad_arbitr"])
+
+    async def _write(self, inn: str, efrsb: dict, kad: dict):
+        row = summary_row(inn, efrsb, kad)
+        self._writer.writerow(row)
+        self._file.flush()
+        self.done += 1
+        if row[-1]:
+            self.errors += 1
+        if self.on_progress is not None:
+            await self.on_progress(self.done, self.total)
+
+
+def write_xlsx(csv_path: str, xlsx_path: str):
+    """Сводка в формате Excel (требуется openpyxl)."""
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("Для вывода в XLSX установите пакет openpyxl")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Сводка")
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            sheet.append(row)
+    workbook.save(xlsx_path)
+
+
+async def run_cli(args):
+    source = sys.stdin if args.input == "-" else open(args.input, "rb")
+    with source:
+        data = source.read()
+    text = data if isinstance(data, str) else decode_upload(data)
+    inns, invalid = parse_inns(text)
+    for inn in invalid:
+        logger.warning("Пропущен некорректный ИНН %s", inn)
+    if not inns:
+        print("Не найдено ни одного корректного ИНН", file=sys.stderr)
+        return 1
+
+    xlsx_path = args.output if args.output.lower().endswith(".xlsx") else None
+    csv_path = f"{os.path.splitext(args.output)[0]}.csv" if xlsx_path else args.output
+    if xlsx_path and not XLSX_AVAILABLE:
+        print("Для вывода в XLSX установите пакет openpyxl", file=sys.stderr)
+        return 1
+
+    async def progress(done, total):
+        print(f"\rГотово {done} из {total}", end="", file=sys.stderr, flush=True)
+
+    print(f"ИНН к проверке: {len(inns)}, некорректных: {len(invalid)}", file=sys.stderr)
+    async with aiohttp.ClientSession() as session:
+        try:
+            stats = await BulkRun(session, inns, csv_path, args.efrsb_url, args.kad_arbitr_url, progress,
+                                  overwrite=args.force).run()
+        except BulkOutputError as e:
+            print(f"{e}. Укажите другой файл (-o) или --force для перезаписи", file=sys.stderr)
+            return 1
+    print(file=sys.stderr)
+    if xlsx_path:
+        write_xlsx(csv_path, xlsx_path)
+    print(f"Сводка сохранена в {xlsx_path or csv_path}, с ошибками: {stats['errors']}", file=sys.stderr)
+    return 0
+
+
+def main():
+    """Массовая проверка ИНН из файла или стандартного ввода."""
+    setup_logging(os.getenv('LOG_FILE'), level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Массовая проверка ИНН по ЕФРСБ и Кад.арбитр")
+    parser.add_argument("input", help="файл со списком ИНН (.txt/.csv) или '-' для стандартного ввода")
+    parser.add_argument("-o", "--output", default="bulk_result.csv",
+                        help="файл сводки .csv или .xlsx; повторный запуск прерванной проверки "
+                             "с тем же файлом и списком ИНН продолжает ее")
+    parser.add_argument("--force", action="store_true", help="перезаписать сводку, построенную по другому списку ИНН")
+    parser.add_argument("--efrsb-url", default=EFRSB_URL)
+    parser.add_argument("--kad-arbitr-url", default=KAD_ARBITR_URL)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run_cli(args)))
+
+
+if __name__ == '__main__':
+    main()
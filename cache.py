@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachePolicy:
+    """Сроки хранения результатов одного источника, в секундах."""
+    ttl: int
+    negative_ttl: int
+    # Сколько после истечения ttl устаревший результат еще можно отдавать,
+    # параллельно обновляя его в фоне (stale-while-revalidate)
+    stale_ttl: int = 0
+
+
+@dataclass
+class CacheEntry:
+    value: dict
+    negative: bool
+    stored_at: float
+    expires_at: float
+    stale_until: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    @property
+    def usable(self) -> bool:
+        return time.time() < self.stale_until
+
+
+class ResultCache:
+    """Двухуровневый кэш результатов поиска по ключу (источник, ИНН).
+
+    Первый уровень - LRU в памяти процесса, второй - SQLite-файл,
+    благодаря которому кэш переживает перезапуск бота.
+    """
+
+    def __init__(self, path: str, policies: dict, memory_size: int = 1000):
+        self.path = path
+        self.policies = policies
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " source TEXT NOT NULL,"
+            " inn TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " negative INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " stale_until REAL NOT NULL,"
+            " PRIMARY KEY (source, inn))"
+        )
+        self._db.commit()
+
+    def _remember(self, key, entry: CacheEntry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, source: str, inn: str):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, negative, stored_at, expires_at, stale_until FROM results WHERE source = ? AND inn = ?",
+                (source, inn)
+            ).fetchone()
+        if row is None:
+            return None
+        value, negative, stored_at, expires_at, stale_until = row
+        return CacheEntry(json.loads(value), bool(negative), stored_at, expires_at, stale_until)
+
+    def _save(self, source: str, inn: str, entry: CacheEntry):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, inn, json.dumps(entry.value, ensure_ascii=False), int(entry.negative),
+                 entry.stored_at, entry.expires_at, entry.stale_until)
+            )
+            self._db.commit()
+
+    def _delete(self, source: str, inn: str):
+        with self._db_lock:
+            self._db.execute("DELETE FROM results WHERE source = ? AND inn = ?", (source, inn))
+            self._db.commit()
+
+    async def get(self, source: str, inn: str):
+        """Запись кэша (свежая или еще пригодная устаревшая) либо None."""
+        key = (source, inn)
+        entry = self._memory.get(key)
+        if entry is None:
+            try:
+                entry = await asyncio.to_thread(self._load, source, inn)
+            except sqlite3.Error as e:
+                logger.error("Ошибка чтения кэша для %s/%s: %s", source, inn, e)
+                return None
+        if entry is None:
+            return None
+        if not entry.usable:
+            self._memory.pop(key, None)
+            await asyncio.to_thread(self._delete, source, inn)
+            return None
+        self._remember(key, entry)
+        return entry
+
+    async def set(self, source: str, inn: str, value: dict, negative: bool = False):
+        """Сохранение результата с учетом политики источника."""
+        policy = self.policies[source]
+        now = time.time()
+        expires_at = now + (policy.negative_ttl if negative else policy.ttl)
+        entry = CacheEntry(value, negative, now, expires_at, expires_at + policy.stale_ttl)
+        self._remember((source, inn), entry)
+        try:
+            await asyncio.to_thread(self._save, source, inn, entry)
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи в кэш для %s/%s: %s", source, inn, e)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,99 @@
+import logging
+import math
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Предохранитель для обращений к сервису: closed -> open -> half_open -> closed.
+
+    После failure_threshold сбоев подряд предохранитель размыкается, и запросы
+    сразу получают отказ, не дожидаясь тайм-аута. Через reset_timeout секунд
+    пропускается один пробный запрос: при успехе цепь замыкается, при сбое -
+    снова размыкается на reset_timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30, on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # Вызывается при смене состояния: fn(name, state)
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("Предохранитель сервиса %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        if self.on_change is not None:
+            self.on_change(self.name, state)
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._set_state(OPEN)
+
+    @property
+    def retry_after(self) -> float:
+        """Через сколько секунд будет пропущен пробный запрос (0 - запросы проходят)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос. В состоянии half_open пропускается только один пробный запрос."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self.retry_after > 0:
+                return False
+            self._set_state(HALF_OPEN)
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self._probing = False
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """Запрос прерван без результата (например, отменен): пробный запрос можно повторить."""
+        self._probing = False
+
+
+class LatencyWindow:
+    """Длительности последних успешных запросов для оценки перцентилей."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        """Перцентиль по последним запросам или None, если данных пока мало."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedJob:
+    """Задача из постоянной очереди: только сериализуемые данные."""
+    id: int
+    inn: str
+    user_id: int
+    priority: int
+    attempts: int
+    enqueued_at: float
+    # Получатели результата: (chat_id, message_id запроса, message_id сообщения о статусе или None)
+    subscribers: list = field(default_factory=list)
+
+
+class SQLiteJobQueue:
+    """Постоянная очередь задач в SQLite: задачи переживают перезапуск и доступны нескольким процессам.
+
+    Задачи обслуживаются по приоритету, а внутри приоритета - по кругу между
+    пользователями: k-я задача пользователя получает номер круга user_seq,
+    поэтому пользователь, отправивший 20 ИНН подряд, не блокирует остальных.
+
+    Для оценки времени ожидания очередь хранит среднее (EWMA) время выполнения
+    задач каждого приоритета - общее для всех процессов воркеров.
+
+    Воркер берет задачу в аренду (lease) и подтверждает ее (ack) или возвращает
+    с ошибкой (nack). Возвращенная задача повторяется с экспоненциальной
+    задержкой, после max_attempts попыток - попадает в список "мертвых" задач.
+    Задача, аренда которой истекла (процесс воркера упал), возвращается в очередь.
+    """
+
+    def __init__(self, path: str, maxsize: int = 0, max_attempts: int = 3, retry_delay: float = 30,
+                 lease_timeout: float = 300, poll_interval: float = 1, service_time_alpha: float = 0.2):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self.service_time_alpha = service_time_alpha
+        self._db_lock = threading.Lock()
+        self._added = asyncio.Event()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " inn TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " user_seq INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " lease_until REAL,"
+            " worker TEXT,"
+            " last_error TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_order ON jobs (state, priority, user_seq, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_inn ON jobs (inn, state)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers ("
+            " job_id INTEGER NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,"
+            " chat_id INTEGER NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " status_message_id INTEGER,"
+            " PRIMARY KEY (job_id, chat_id, message_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS service_times ("
+            " priority INTEGER PRIMARY KEY,"
+            " seconds REAL NOT NULL,"
+            " samples INTEGER NOT NULL)"
+        )
+
+    def _run(self, func, *args):
+        """Выполнение func(*args) в одной транзакции, которая сразу берет блокировку записи."""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    async def _call(self, func, *args):
+        return await asyncio.to_thread(self._run, func, *args)
+
+    def _count(self, where: str = "", params: tuple = ()) -> int:
+        return self._db.execute(f"SELECT COUNT(*) FROM jobs WHERE state = 'queued' {where}", params).fetchone()[0]
+
+    def _put(self, inn: str, user_id: int, chat_id: int, message_id: int, priority: int) -> int:
+        if self.maxsize and self._count() >= self.maxsize:
+            raise asyncio.QueueFull
+        # Следующий круг пользователя; новый пользователь встает в текущий круг
+        user_seq, = self._db.execute(
+            "SELECT MAX(user_seq) + 1 FROM jobs WHERE user_id = ? AND state IN ('queued', 'leased')", (user_id,)
+        ).fetchone()
+        if user_seq is None:
+            user_seq = self._db.execute("SELECT MIN(user_seq) FROM jobs WHERE state = 'queued'").fetchone()[0] or 1
+        now = time.time()
+        job_id = self._db.execute(
+            "INSERT INTO jobs (inn, user_id, priority, user_seq, state, available_at, created_at)"
+            " VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+            (inn, user_id, priority, user_seq, now, now)
+        ).lastrowid
+        self._db.execute("INSERT INTO subscribers (job_id, chat_id, message_id) VALUES (?, ?, ?)",
+                         (job_id, chat_id, message_id))
+        return job_id
+
+    async def put(self, inn: str, user_id: int, chat_id: int, message_id: int, priority: int) -> int:
+        """Добавление задачи. При переполнении очереди - asyncio.QueueFull."""
+        job_id = await self._call(self._put, inn, user_id, chat_id, message_id, priority)
+        self._added.set()
+        return job_id
+
+    def _raise_priorities(self, minimum: int) -> int:
+        return self._db.execute("UPDATE jobs SET priority = ? WHERE priority < ? AND state IN ('queued', 'leased')",
+                                (minimum, minimum)).rowcount
+
+    async def raise_priorities(self, minimum: int) -> int:
+        """Перевод задач с приоритетом ниже minimum (из прежних версий) на minimum. Возвращает число задач."""
+        return await self._call(self._raise_priorities, minimum)
+
+    def _find_queued(self, inn: str):
+        row = self._db.execute("SELECT id FROM jobs WHERE inn = ? AND state = 'queued' ORDER BY id LIMIT 1",
+                               (inn,)).fetchone()
+        return row[0] if row else None
+
+    async def find_queued(self, inn: str):
+        """Ожидающая задача по тому же ИНН, к которой можно присоединиться, или None."""
+        return await self._call(self._find_queued, inn)
+
+    def _subscribe(self, job_id: int, chat_id: int, message_id: int, states: tuple) -> bool:
+        row = self._db.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] not in states:
+            return False
+        self._db.execute("INSERT OR IGNORE INTO subscribers (job_id, chat_id, message_id) VALUES (?, ?, ?)",
+                         (job_id, chat_id, message_id))
+        return True
+
+    async def subscribe(self, job_id: int, chat_id: int, message_id: int, leased: bool = False) -> bool:
+        """Добавление получателя к ожидающей задаче. False, если задачу уже взял воркер.
+
+        leased=True - добавление и к выполняющейся задаче (ее выполняет этот процесс),
+        чтобы получатель сохранился для повтора после ошибки.
+        """
+        states = ("queued", "leased") if leased else ("queued",)
+        return await self._call(self._subscribe, job_id, chat_id, message_id, states)
+
+    def _set_status_message(self, job_id: int, chat_id: int, message_id: int, status_message_id: int):
+        self._db.execute(
+            "UPDATE subscribers SET status_message_id = ? WHERE job_id = ? AND chat_id = ? AND message_id = ?",
+            (status_message_id, job_id, chat_id, message_id)
+        )
+
+    async def set_status_message(self, job_id: int, chat_id: int, message_id: int, status_message_id: int):
+        """Запоминание сообщения о статусе: с него начнется отчет."""
+        await self._call(self._set_status_message, job_id, chat_id, message_id, status_message_id)
+
+    def _subscribers(self, job_id: int) -> list:
+        return self._db.execute(
+            "SELECT chat_id, message_id, status_message_id FROM subscribers WHERE job_id = ?", (job_id,)
+        ).fetchall()
+
+    def _requeue_expired(self, now: float):
+        """Возврат в очередь задач, аренда которых истекла (воркер упал или завис)."""
+        expired = self._db.execute(
+            "SELECT id, inn, attempts FROM jobs WHERE state = 'leased' AND lease_until < ?", (now,)
+        ).fetchall()
+        for job_id, inn, attempts in expired:
+            logger.warning("Истекла аренда задачи %s для ИНН %s (попытка %s)", job_id, inn, attempts)
+            self._fail(job_id, attempts, "Истек срок аренды задачи", now)
+
+    def _lease(self, worker: str):
+        now = time.time()
+        self._requeue_expired(now)
+        row = self._db.execute(
+            "SELECT id, inn, user_id, priority, attempts, created_at FROM jobs"
+            " WHERE state = 'queued' AND available_at <= ? ORDER BY priority DESC, user_seq, id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, inn, user_id, priority, attempts, created_at = row
+        self._db.execute(
+            "UPDATE jobs SET state = 'leased', attempts = attempts + 1, lease_until = ?, worker = ? WHERE id = ?",
+            (now + self.lease_timeout, worker, job_id)
+        )
+        return QueuedJob(job_id, inn, user_id, priority, attempts + 1, created_at, self._subscribers(job_id))
+
+    async def lease(self, worker: str):
+        """Аренда следующей готовой задачи или None, если таких нет."""
+        return await self._call(self._lease, worker)
+
+    async def get(self, worker: str) -> QueuedJob:
+        """Ожидание и аренда следующей задачи.
+
+        Задачи, добавленные в этом процессе, забираются сразу, добавленные
+        другими процессами - при очередном опросе раз в poll_interval секунд.
+        """
+        while True:
+            self._added.clear()
+            job = await self.lease(worker)
+            if job is not None:
+                return job
+            try:
+                await asyncio.wait_for(self._added.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _extend(self, job_id: int):
+        self._db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'leased'",
+                         (time.time() + self.lease_timeout, job_id))
+
+    async def extend(self, job_id: int):
+        """Продление аренды задачи, которая еще выполняется."""
+        await self._call(self._extend, job_id)
+
+    def _release(self, job_id: int):
+        self._db.execute(
+            "UPDATE jobs SET state = 'queued', attempts = attempts - 1, lease_until = NULL, worker = NULL"
+            " WHERE id = ? AND state = 'leased'", (job_id,)
+        )
+
+    async def release(self, job_id: int):
+        """Возврат прерванной задачи (остановка воркера) без учета попытки."""
+        await self._call(self._release, job_id)
+
+    def _record_service_time(self, priority: int, seconds: float):
+        row = self._db.execute("SELECT seconds, samples FROM service_times WHERE priority = ?",
+                               (priority,)).fetchone()
+        if row is None:
+            self._db.execute("INSERT INTO service_times (priority, seconds, samples) VALUES (?, ?, 1)",
+                             (priority, seconds))
+            return
+        average, samples = row
+        # Первые замеры усредняются поровну, дальше вес новых замеров не меньше service_time_alpha
+        alpha = max(1 / (samples + 1), self.service_time_alpha)
+        self._db.execute("UPDATE service_times SET seconds = ?, samples = ? WHERE priority = ?",
+                         (average + alpha * (seconds - average), samples + 1, priority))
+
+    def _ack(self, job_id: int, seconds: float):
+        row = self._db.execute("SELECT priority FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        if row is not None and seconds is not None:
+            self._record_service_time(row[0], seconds)
+
+    async def ack(self, job_id: int, seconds: float = None):
+        """Подтверждение успешного выполнения: задача удаляется из очереди.
+
+        seconds - время выполнения задачи для оценки времени ожидания.
+        """
+        await self._call(self._ack, job_id, seconds)
+
+    def _service_times(self) -> dict:
+        return dict(self._db.execute("SELECT priority, seconds FROM service_times").fetchall())
+
+    async def service_times(self) -> dict:
+        """Среднее время выполнения задач по приоритетам: приоритет -> секунды."""
+        return await self._call(self._service_times)
+
+    def _fail(self, job_id: int, attempts: int, error: str, now: float) -> bool:
+        if attempts >= self.max_attempts:
+            self._db.execute(
+                "UPDATE jobs SET state = 'dead', lease_until = NULL, worker = NULL, last_error = ? WHERE id = ?",
+                (error, job_id)
+            )
+            return False
+        self._db.execute(
+            "UPDATE jobs SET state = 'queued', available_at = ?, lease_until = NULL, worker = NULL, last_error = ?"
+            " WHERE id = ?",
+            (now + self.retry_delay * 2 ** (attempts - 1), error, job_id)
+        )
+        return True
+
+    def _nack(self, job_id: int, error: str) -> bool:
+        row = self._db.execute("SELECT attempts FROM jobs WHERE id = ? AND state = 'leased'", (job_id,)).fetchone()
+        if row is None:
+            return False
+        return self._fail(job_id, row[0], error, time.time())
+
+    async def nack(self, job_id: int, error: str) -> bool:
+        """Возврат задачи после ошибки. True - задача будет повторена, False - перенесена в "мертвые"."""
+        return await self._call(self._nack, job_id, error)
+
+    def _dead_letters(self, limit: int) -> list:
+        return self._db.execute(
+            "SELECT id, inn, user_id, attempts, last_error, created_at FROM jobs WHERE state = 'dead'"
+            " ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    async def dead_letters(self, limit: int = 100) -> list:
+        """Задачи, не выполненные за max_attempts попыток: (id, ИНН, пользователь, попытки, ошибка, создана)."""
+        return await self._call(self._dead_letters, limit)
+
+    async def qsize(self) -> int:
+        return await self._call(self._count)
+
+    async def user_qsize(self, user_id: int) -> int:
+        """Количество задач пользователя, ожидающих в очереди."""
+        return await self._call(self._count, "AND user_id = ?", (user_id,))
+
+    def _ordered(self) -> list:
+        jobs = self._db.execute(
+            "SELECT id, priority FROM jobs WHERE state = 'queued' ORDER BY priority DESC, user_seq, id"
+        ).fetchall()
+        return [(job_id, priority, self._subscribers(job_id)) for job_id, priority in jobs]
+
+    async def ordered(self) -> list:
+        """Ожидающие задачи в порядке обслуживания: (id, приоритет, получатели)."""
+        return await self._call(self._ordered)
+
+    def _running(self) -> list:
+        return [priority for priority, in self._db.execute("SELECT priority FROM jobs WHERE state = 'leased'")]
+
+    async def running(self) -> list:
+        """Приоритеты выполняющихся задач."""
+        return await self._call(self._running)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Уровень логов и ротация файла лога по размеру
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+# Заголовок, которым бот передает идентификатор запроса сервисам парсеров
+REQUEST_ID_HEADER = "X-Request-ID"
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Идентификатор запроса пользователя: один и тот же в логах бота и обоих сервисов парсеров
+request_id = ContextVar("request_id", default="-")
+
+_listener = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def request_context(value: str):
+    """Идентификатор запроса для всех записей лога внутри блока (и запущенных в нем задач)."""
+    token = request_id.set(value)
+    try:
+        yield value
+    finally:
+        request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавление идентификатора запроса к записи в том потоке и задаче, где она создана."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Передача записи в очередь без форматирования.
+
+    Стандартный QueueHandler собирает текст сообщения в вызывающем потоке; здесь
+    сообщение, аргументы и исключение форматирует поток QueueListener, поэтому
+    в цикле событий запись в лог стоит одной вставки в очередь.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(log_file: str = None, level: str = LOG_LEVEL):
+    """Общая настройка логов процесса: JSON в файл с ротацией и текст в консоль.
+
+    Обработчики работают в отдельном потоке QueueListener, поэтому запись файла
+    не блокирует цикл событий. log_file=None - только консоль. Повторный вызов
+    ничего не меняет.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handlers = []
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers.append(console)
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                           encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Подавление HTTP-логов
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
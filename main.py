@@ -2,8 +2,10 @@ import os
 import re
 import logging
 import asyncio
-import json
 import time
+import math
+from contextlib import aclosing
+from dataclasses import dataclass, field
 import aiohttp
 from dotenv import load_dotenv
 from telegram import Update
@@ -16,15 +18,38 @@ from telegram.ext import (
 )
 from telegram.error import TimedOut
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
+from bulk import (
+    BULK_MAX_INNS,
+    XLSX_AVAILABLE,
+    BulkRun,
+    decode_upload,
+    inns_digest,
+    is_valid_inn,
+    parse_inns,
+    remove_bulk_files,
+    write_xlsx,
+)
+from cache import CachePolicy, ResultCache
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyWindow
+from job_queue import QueuedJob, SQLiteJobQueue
+from logging_setup import REQUEST_ID_HEADER, request_context, request_id, setup_logging
+from metrics import REGISTRY, counter, gauge, histogram, start_metrics_server
+from parsers.models import Case, Individual, LegalEntity, loads, validate_items
+from report import (
+    STAGE_SECONDS,
+    MessageRef,
+    ReportRenderer,
+    TELEGRAM_MESSAGE_LIMIT,
+    case_blocks,
+    closing_block,
+    efrsb_blocks,
+    header_blocks,
+    kad_result_blocks,
+    kad_title_block,
+    split_block,
 )
+from storage import HistoryStore
+
 logger = logging.getLogger(__name__)
 
 # Загрузка переменных из .env файла
@@ -34,235 +59,1111 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
 # URLs сервисов
-EFRSB_URL = "http://localhost:5001/efrsb"
-KAD_ARBITR_URL = "http://localhost:5002/kad_arbitr"
+EFRSB_URL = os.getenv('EFRSB_URL', "http://localhost:5001/efrsb")
+KAD_ARBITR_URL = os.getenv('KAD_ARBITR_URL', "http://localhost:5002/kad_arbitr")
+
+# Постраничная загрузка дел Кад.арбитр: ограничения и тайм-аут ожидания очередной пачки дел
+KAD_MAX_PAGES = int(os.getenv('KAD_MAX_PAGES', 10))
+KAD_MAX_CASES = int(os.getenv('KAD_MAX_CASES', 250))
+
+# Общий HTTP-клиент на все время работы бота: keep-alive соединения к сервисам
+# переиспользуются между запросами, число соединений к одному сервису ограничено
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 20))
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 75))
+# Тайм-ауты сервисов: на установку соединения и на ожидание очередной порции ответа
+SERVICE_TIMEOUTS = {
+    "efrsb": aiohttp.ClientTimeout(
+        total=None,
+        connect=float(os.getenv('EFRSB_CONNECT_TIMEOUT', 3)),
+        sock_read=float(os.getenv('EFRSB_READ_TIMEOUT', 30)),
+    ),
+    "kad_arbitr": aiohttp.ClientTimeout(
+        total=None,
+        connect=float(os.getenv('KAD_ARBITR_CONNECT_TIMEOUT', 3)),
+        sock_read=float(os.getenv('KAD_ARBITR_READ_TIMEOUT', 30)),
+    ),
+}
+http_session = None
+
+# Кэш результатов: у каждого источника свой срок жизни, отдельный срок для ответов
+# "не найдено" и окно, в котором устаревший ответ отдается с фоновым обновлением
+CACHE_PATH = os.getenv('CACHE_PATH', 'cache.sqlite3')
+CACHE_MEMORY_SIZE = int(os.getenv('CACHE_MEMORY_SIZE', 1000))
+CACHE_POLICIES = {
+    "efrsb": CachePolicy(
+        ttl=int(os.getenv('CACHE_TTL_EFRSB', 6 * 3600)),
+        negative_ttl=int(os.getenv('CACHE_NEGATIVE_TTL_EFRSB', 3600)),
+        stale_ttl=int(os.getenv('CACHE_STALE_TTL_EFRSB', 24 * 3600)),
+    ),
+    "kad_arbitr": CachePolicy(
+        ttl=int(os.getenv('CACHE_TTL_KAD_ARBITR', 3 * 3600)),
+        negative_ttl=int(os.getenv('CACHE_NEGATIVE_TTL_KAD_ARBITR', 1800)),
+        stale_ttl=int(os.getenv('CACHE_STALE_TTL_KAD_ARBITR', 12 * 3600)),
+    ),
+}
+result_cache = ResultCache(CACHE_PATH, CACHE_POLICIES, memory_size=CACHE_MEMORY_SIZE)
+# Ключи (источник, ИНН), для которых уже идет фоновое обновление кэша
+refreshing = set()
+
+# История результатов и подписки на изменения по ИНН (/watch): период проверки,
+# повтор при ошибке сервисов, частота поиска подписок к проверке, лимит подписок на чат
+HISTORY_PATH = os.getenv('HISTORY_PATH', 'history.sqlite3')
+WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL', 6 * 3600))
+WATCH_RETRY_INTERVAL = int(os.getenv('WATCH_RETRY_INTERVAL', 15 * 60))
+WATCH_POLL_INTERVAL = 60
+WATCH_MAX_PER_CHAT = int(os.getenv('WATCH_MAX_PER_CHAT', 20))
+history = HistoryStore(HISTORY_PATH)
+
+# Метрики (GET /metrics): сервер на локальном порту, 0 - отключен.
+# Каждому процессу worker.py нужен свой порт (9100 по умолчанию занят node_exporter)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9321))
+metrics_runner = None
+QUEUE_DEPTH = gauge("bot_queue_depth", "Задач, ожидающих в очереди")
+QUEUE_WAIT = histogram("bot_queue_wait_seconds", "Ожидание задачи в очереди до начала обработки")
+WORKERS_TOTAL = gauge("bot_workers_total", "Воркеров в процессе")
+WORKERS_BUSY = gauge("bot_workers_busy", "Воркеров, обрабатывающих задачу")
+JOBS = counter("bot_jobs_total", "Завершенные попытки обработки задач", ("result",))
+REJECTED_REQUESTS = counter("bot_rejected_requests_total", "Запросы, не принятые в очередь", ("reason",))
+REQUEST_SECONDS = histogram("bot_request_seconds", "Обработка запроса от начала до отправки отчета")
+CACHE_REQUESTS = counter("bot_cache_requests_total", "Обращения к кэшу результатов", ("source", "result"))
+SERVICE_ERRORS = counter("bot_service_errors_total", "Ошибки запросов к сервисам", ("source", "kind"))
+CIRCUIT_STATE = gauge("bot_circuit_state", "Состояние предохранителя сервиса: 0 - closed, 1 - half_open, 2 - open",
+                      ("source",))
+HEDGED_REQUESTS = counter("bot_hedged_requests_total", "Дублирующие запросы к медленному сервису", ("source", "winner"))
+
+# Предохранители сервисов: после BREAKER_FAILURES сбоев подряд запросы к сервису
+# сразу получают отказ (или ответ из кэша) на BREAKER_RESET_TIMEOUT секунд
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+SERVICE_UNAVAILABLE = "Сервис временно недоступен, попробуйте позже"
+# Дублирующие запросы: если ответ не пришел за p95 обычного времени ответа, отправляется
+# второй запрос и берется первый успешный. Включаются для перечисленных источников
+# (например, "efrsb"), так как удваивают нагрузку на браузер сервиса
+HEDGE_SOURCES = {s.strip() for s in os.getenv('HEDGE_SOURCES', '').split(',') if s.strip()}
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 1))
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+circuit_breakers = {
+    source: CircuitBreaker(
+        source, BREAKER_FAILURES, BREAKER_RESET_TIMEOUT,
+        on_change=lambda name, state: CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES[state], source=name)
+    )
+    for source in SERVICE_TIMEOUTS
+}
+for source in circuit_breakers:
+    CIRCUIT_STATE.set(CIRCUIT_STATE_VALUES[CLOSED], source=source)
+service_latency = {source: LatencyWindow() for source in SERVICE_TIMEOUTS}
+
+# Пул воркеров и допуск в очередь: запрос принимается, если ожидаемое время до готовности
+# отчета (задачи впереди по среднему времени выполнения, деленные на число воркеров) не больше
+# MAX_QUEUE_WAIT секунд. При WORKERS_COUNT=0 бот только принимает запросы, а выполняют их
+# отдельные процессы worker.py - тогда их общее число воркеров задается QUEUE_WORKERS
+WORKERS_COUNT = int(os.getenv('WORKERS_COUNT', 3))
+QUEUE_WORKERS = int(os.getenv('QUEUE_WORKERS', WORKERS_COUNT or 1))
+MAX_QUEUE_WAIT = int(os.getenv('MAX_QUEUE_WAIT', 600))
+# Жесткий предел числа задач в очереди (0 - без предела)
+MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', 0))
+MAX_USER_QUEUE = int(os.getenv('MAX_USER_QUEUE', 5))
+# Приоритеты задач: запросы, ответ на которые уже есть в кэше, выполняются за секунды
+# и идут первыми, за ними - одиночные запросы пользователей. Массовая проверка идет
+# в обход очереди пакетными запросами и уступает сервисы, пока в очереди есть задачи
+PRIORITY_WARM = 2
+PRIORITY_INTERACTIVE = 1
+# Время выполнения задачи по приоритетам, пока очередь не накопила замеров, секунды
+DEFAULT_JOB_SECONDS = {PRIORITY_WARM: 3, PRIORITY_INTERACTIVE: 30}
+
+# Постоянная очередь запросов с круговым обслуживанием пользователей: переживает
+# перезапуск бота и может обслуживаться несколькими процессами воркеров
+QUEUE_PATH = os.getenv('QUEUE_PATH', 'queue.sqlite3')
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 30))
+JOB_LEASE_TIMEOUT = int(os.getenv('JOB_LEASE_TIMEOUT', 300))
+request_queue = SQLiteJobQueue(
+    QUEUE_PATH, maxsize=MAX_QUEUE_SIZE, max_attempts=JOB_MAX_ATTEMPTS,
+    retry_delay=JOB_RETRY_DELAY, lease_timeout=JOB_LEASE_TIMEOUT
+)
+# Как часто обновлять сообщения с позицией в очереди и ожидаемым временем, секунды
+POSITIONS_REFRESH_INTERVAL = 5
+# Показанные статусы: (chat_id, message_id сообщения о статусе) -> текст
+shown_statuses = {}
+
+# Задачи, выполняющиеся в этом процессе, по ИНН: повторные запросы того же ИНН
+# присоединяются к ним с догоняющим выводом отчета, а не запускают новый поиск
+inflight = {}
+
+# Массовая проверка: каталог сводок (по ним проверка продолжается после перезапуска),
+# ограничение размера файла и частота обновления сообщения о ходе проверки
+BULK_DIR = os.getenv('BULK_DIR', 'bulk')
+BULK_MAX_FILE_SIZE = 1024 * 1024
+BULK_PROGRESS_INTERVAL = 5
+# Пакет массовой проверки ждет, пока очередь одиночных запросов не опустеет, но не дольше
+# BULK_YIELD_MAX_WAIT секунд, чтобы массовая проверка не остановилась при постоянном потоке запросов
+BULK_YIELD_MAX_WAIT = int(os.getenv('BULK_YIELD_MAX_WAIT', 60))
+# Пользователи, у которых выполняется массовая проверка
+bulk_users = set()
+
+# Фоновые задачи (воркеры и обновление позиций в очереди)
+worker_tasks = []
+background_tasks = set()
+
+
+@dataclass
+class Subscriber:
+    """Пользователь, ожидающий результат задачи."""
+    # Сообщение с запросом (telegram.Message или MessageRef): отчет отправляется в тот же чат
+    message: object
+    status_message: object = None
+    renderer: ReportRenderer = None
+
+
+@dataclass
+class Job:
+    """Поиск по ИНН, результат которого получат все подписчики."""
+    id: int
+    inn: str
+    user_id: int
+    subscribers: list = field(default_factory=list)
+    attempts: int = 1
+    enqueued_at: float = field(default_factory=time.time)
+    # Уже опубликованные части отчета: (блоки, заголовок продолжения) и текущая подпись о загрузке
+    report_log: list = field(default_factory=list)
+    footer: str = ""
+    # Идентификатор для логов: по первому сообщению с запросом
+    request_id: str = "-"
+
+
+def message_request_id(chat_id: int, message_id: int) -> str:
+    """Идентификатор запроса в логах бота и сервисов парсеров."""
+    return f"{chat_id}:{message_id}"
+
+
+def format_wait(seconds: float) -> str:
+    if seconds < 60:
+        return "меньше минуты"
+    return f"около {math.ceil(seconds / 60)} мин"
 
-# Очередь для обработки запросов
-request_queue = asyncio.Queue()
+
+def queue_position_text(position: int, eta: float) -> str:
+    return (f"Ваш запрос принят. Позиция в очереди: {position}, ожидание отчета: {format_wait(eta)}. "
+            "Пожалуйста, ожидайте.")
+
+
+def queue_full_text(wait: float = None) -> str:
+    if wait is None:
+        return "Очередь переполнена. Пожалуйста, попробуйте позже."
+    return f"Очередь переполнена: ожидание составит {format_wait(wait)}. Пожалуйста, попробуйте позже."
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start."""
     user_id = update.effective_user.id
-    logger.info(f"Пользователь {user_id} запустил команду /start")
+    logger.info("Пользователь %s запустил команду /start", user_id)
     try:
         await update.message.reply_text(
             "Уважаемый пользователь,\n\n"
             "Я бот для поиска информации по ИНН на сайтах ЕФРСБ и Кад.арбитр. "
-            "Введите ИНН (10 или 12 цифр) для поиска."
+            "Введите ИНН (10 или 12 цифр) для поиска или отправьте файл .txt/.csv "
+            "со списком ИНН для массовой проверки.\n"
+            "Команда /watch <ИНН> - подписка на новые дела и изменения статусов."
         )
     except TimedOut:
-        logger.warning(f"Тайм-аут при выполнении команды /start для пользователя {user_id}")
+        logger.warning("Тайм-аут при выполнении команды /start для пользователя %s", user_id)
         await asyncio.sleep(2)
         await update.message.reply_text(
             "Уважаемый пользователь,\n\n"
             "Я бот для поиска информации по ИНН на сайтах ЕФРСБ и Кад.арбитр. "
-            "Введите ИНН (10 или 12 цифр) для поиска."
+            "Введите ИНН (10 или 12 цифр) для поиска или отправьте файл .txt/.csv "
+            "со списком ИНН для массовой проверки.\n"
+            "Команда /watch <ИНН> - подписка на новые дела и изменения статусов."
         )
 
 
-async def fetch_service_data(session: aiohttp.ClientSession, url: str, inn: str):
-    """Отправка POST-запроса к сервису."""
-    payload = {"inn": inn}
+def create_http_session() -> aiohttp.ClientSession:
+    """HTTP-клиент с пулом keep-alive соединений к сервисам."""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+class ServiceHTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def circuit_open(source: str, inn: str) -> bool:
+    """Проверка предохранителя сервиса перед запросом; при разомкнутом - учет отказа."""
+    breaker = circuit_breakers[source]
+    if breaker.allow():
+        return False
+    logger.warning("Сервис %s недоступен (повтор через %.0f с), запрос для ИНН %s не отправлен",
+                   source, breaker.retry_after, inn)
+    SERVICE_ERRORS.inc(source=source, kind="circuit_open")
+    return True
+
+
+def validate_response(source: str, data) -> None:
+    """Проверка успешного ответа сервиса по моделям результатов: расхождение схем - ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("ответ не является объектом")
+    if data.get("status") != "success":
+        return
+    if source == "efrsb":
+        validate_items(Individual, data.get("individuals", []))
+        validate_items(LegalEntity, data.get("legal_entities", []))
+    else:
+        validate_items(Case, data.get("data", {}).get("cases", []))
+
+
+async def post_service(session: aiohttp.ClientSession, source: str, url: str, inn: str) -> dict:
+    """Один POST-запрос к сервису; длительность успешного ответа учитывается для дублирующих запросов."""
+    headers = {REQUEST_ID_HEADER: request_id.get()}
+    start = time.perf_counter()
+    async with session.post(url, json={"inn": inn}, headers=headers, timeout=SERVICE_TIMEOUTS[source]) as response:
+        if response.status != 200:
+            raise ServiceHTTPError(response.status)
+        data = await response.json(loads=loads)
+    service_latency[source].add(time.perf_counter() - start)
+    return data
+
+
+async def hedged_post(session: aiohttp.ClientSession, source: str, url: str, inn: str, delay: float) -> dict:
+    """Запрос с дублированием: второй запрос уходит через delay секунд, побеждает первый успешный ответ."""
+    attempts = [asyncio.create_task(post_service(session, source, url, inn))]
     try:
-        async with session.post(url, json=payload, timeout=10) as response:
-            if response.status != 200:
-                logger.error(f"Ошибка HTTP {response.status} при запросе к {url} для ИНН {inn}")
-                return {"error": f"HTTP {response.status}"}
-            return await response.json()
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            logger.info("Ответ %s для ИНН %s не получен за %.1f с, отправляю дублирующий запрос", source, inn, delay)
+            attempts.append(asyncio.create_task(post_service(session, source, url, inn)))
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if len(attempts) > 1:
+                        HEDGED_REQUESTS.inc(source=source, winner="first" if task is attempts[0] else "hedge")
+                    return task.result()
+            if not pending:
+                # Оба запроса не удались: передается ошибка первого
+                raise next(task.exception() for task in done)
+    finally:
+        for task in attempts:
+            task.cancel()
+
+
+async def fetch_service_data(session: aiohttp.ClientSession, source: str, url: str, inn: str):
+    """Отправка POST-запроса к сервису через предохранитель, при необходимости - с дублированием."""
+    if circuit_open(source, inn):
+        return {"error": SERVICE_UNAVAILABLE}
+    breaker = circuit_breakers[source]
+    p95 = service_latency[source].percentile(95) if source in HEDGE_SOURCES else None
+    try:
+        with STAGE_SECONDS.time(source=source, stage="service_fetch"):
+            if p95 is not None and breaker.state == CLOSED:
+                data = await hedged_post(session, source, url, inn, max(p95, HEDGE_MIN_DELAY))
+            else:
+                data = await post_service(session, source, url, inn)
+            validate_response(source, data)
+    except ServiceHTTPError as e:
+        logger.error("Ошибка HTTP %s при запросе к %s для ИНН %s", e.status, url, inn)
+        SERVICE_ERRORS.inc(source=source, kind="http")
+        # Ответ 4xx означает, что сервис работает
+        if e.status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return {"error": str(e)}
     except aiohttp.ClientError as e:
-        logger.error(f"Ошибка при запросе к {url} для ИНН {inn}: {str(e)}")
+        logger.error("Ошибка при запросе к %s для ИНН %s: %s", url, inn, e)
+        SERVICE_ERRORS.inc(source=source, kind="network")
+        breaker.record_failure()
         return {"error": f"Ошибка сети: {str(e)}"}
     except asyncio.TimeoutError:
-        logger.error(f"Тайм-аут при запросе к {url} для ИНН {inn}")
+        logger.error("Тайм-аут при запросе к %s для ИНН %s", url, inn)
+        SERVICE_ERRORS.inc(source=source, kind="timeout")
+        breaker.record_failure()
         return {"error": "Тайм-аут запроса"}
+    except ValueError as e:
+        # Сервис отвечает, но формат ответа не совпадает с моделями бота: ошибка только этого источника
+        logger.error("Некорректный ответ %s для ИНН %s: %s", url, inn, e)
+        SERVICE_ERRORS.inc(source=source, kind="schema")
+        breaker.record_success()
+        return {"error": f"Некорректный ответ сервиса: {str(e)}"}
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    breaker.record_success()
+    return data
 
 
-async def process_request(inn: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка запроса из очереди."""
-    user_id = update.effective_user.id
-    start_time = time.time()
-    logger.info(f"Начало обработки запроса для ИНН {inn} от пользователя {user_id}")
+def is_negative_result(source: str, data: dict) -> bool:
+    """Успешный ответ сервиса без найденных записей ("не найдено")."""
+    if source == "efrsb":
+        return not (data.get("individuals") or data.get("legal_entities"))
+    return not data.get("data", {}).get("cases")
+
 
-    waiting_message = await update.message.reply_text("Обработка данных начата. Пожалуйста, ожидайте.")
+async def fetch_and_cache(session: aiohttp.ClientSession, source: str, url: str, inn: str):
+    """Запрос к сервису с сохранением успешного ответа в кэш."""
+    data = await fetch_service_data(session, source, url, inn)
+    if isinstance(data, dict) and data.get("status") == "success":
+        await result_cache.set(source, inn, data, negative=is_negative_result(source, data))
+        await history.record(source, inn, data)
+    return data
 
+
+async def revalidate(source: str, url: str, inn: str):
+    """Фоновое обновление устаревшей записи кэша."""
     try:
-        async with aiohttp.ClientSession() as session:
-            # Параллельные запросы к сервисам
-            efrsb_task = fetch_service_data(session, EFRSB_URL, inn)
-            kad_arbitr_task = fetch_service_data(session, KAD_ARBITR_URL, inn)
-            efrsb_data, kad_arbitr_data = await asyncio.gather(efrsb_task, kad_arbitr_task, return_exceptions=True)
-
-        # Формирование отчета
-        report = [f"Отчет по должнику (ИНН: {inn})", "============================="]
-        report.append("\n1. Основные данные")
-        report.append("-------------------")
-        report.append(f"- ИНН: {inn}")
-
-        # 2. ЕФРСБ
-        report.append("\n2. ЕФРСБ")
-        report.append("-------------------")
-        if isinstance(efrsb_data, dict) and efrsb_data.get("status") == "success":
-            individuals = efrsb_data.get("individuals", [])
-            legal_entities = efrsb_data.get("legal_entities", [])
-            if not (individuals or legal_entities):
-                report.append("- Банкротство: Не найдено")
-            else:
-                report.append("- Банкротство:")
-                if individuals:
-                    for idx, person in enumerate(individuals, 1):
-                        report.append(f"  - Физическое лицо {idx}:")
-                        report.append(f"    - ФИО: {person.get('full_name', 'Неизвестно')}")
-                        report.append(f"    - Адрес: {person.get('address', 'Неизвестно')}")
-                        report.append(f"    - Статус: {person.get('status', 'Неизвестно')}")
-                        report.append(f"    - Дата статуса: {person.get('status_date', 'Неизвестно')}")
-                        report.append(f"    - Номер дела: {person.get('court_case_number', 'Неизвестно')}")
-                        report.append(
-                            f"    - Арбитражный управляющий: {person.get('arbitration_manager', 'Неизвестно')}")
-                if legal_entities:
-                    for idx, entity in enumerate(legal_entities, 1):
-                        report.append(f"  - Юридическое лицо {idx}:")
-                        report.append(f"    - Название: {entity.get('name', 'Неизвестно')}")
-                        report.append(f"    - ИНН: {entity.get('inn', 'Неизвестно')}")
-                        report.append(f"    - Статус: {entity.get('status', 'Неизвестно')}")
-                        report.append(f"    - Дата статуса: {entity.get('status_date', 'Неизвестно')}")
-                        report.append(f"    - Номер дела: {entity.get('court_case_number', 'Неизвестно')}")
-                        report.append(
-                            f"    - Арбитражный управляющий: {entity.get('arbitration_manager', 'Неизвестно')}")
-        else:
-            error_msg = efrsb_data.get("error", "Неизвестная ошибка") if isinstance(efrsb_data,
-                                                                                    dict) else "Некорректные данные"
-            report.append(f"- Статус: Ошибка: {error_msg}")
-            logger.error(f"Ошибка в данных ЕФРСБ для ИНН {inn}: {error_msg}")
-
-        # 3. Кад.арбитр
-        report.append("\n3. Кад.арбитр")
-        report.append("-------------------")
-        if isinstance(kad_arbitr_data, dict) and kad_arbitr_data.get("status") == "success":
-            cases = kad_arbitr_data.get("data", {}).get("cases", [])
-            if not cases:
-                report.append("- Судебные дела: Не найдены")
-            else:
-                report.append("- Судебные дела:")
-                for idx, case in enumerate(cases, 1):
-                    report.append(f"  - Дело {idx}:")
-                    report.append(f"    - Номер дела: {case.get('case_number', 'Неизвестно')}")
-                    report.append(f"    - Дата регистрации: {case.get('registration_date', 'Неизвестно')}")
-                    report.append(f"    - Судья: {case.get('judge', 'Неизвестно')}")
-                    report.append(f"    - Текущая инстанция: {case.get('current_instance', 'Неизвестно')}")
-                    report.append(f"    - Истец: {case.get('plaintiff', 'Неизвестно')}")
-                    report.append(f"    - Ответчик: {case.get('respondent', 'Неизвестно')}")
-        else:
-            error_msg = kad_arbitr_data.get("error", "Неизвестная ошибка") if isinstance(kad_arbitr_data,
-                                                                                         dict) else "Некорректные данные"
-            report.append(f"- Статус: Ошибка: {error_msg}")
-            logger.error(f"Ошибка в данных Кад.арбитр для ИНН {inn}: {error_msg}")
+        await fetch_and_cache(http_session, source, url, inn)
+        logger.info("Кэш %s для ИНН %s обновлен в фоне", source, inn)
+    finally:
+        refreshing.discard((source, inn))
 
-        report.append("=============================")
-        response = "\n".join(report)
 
-        # Удаление сообщения об ожидании
-        try:
-            await waiting_message.delete()
-        except Exception as e:
-            logger.warning(f"Ошибка при удалении сообщения об ожидании для ИНН {inn}: {str(e)}")
+def serve_cached(entry, source: str, url: str, inn: str):
+    """Данные из записи кэша; для устаревшей записи запускается фоновое обновление."""
+    CACHE_REQUESTS.inc(source=source, result="hit" if entry.fresh else "stale")
+    if entry.fresh:
+        logger.info("Данные %s для ИНН %s взяты из кэша", source, inn)
+    else:
+        logger.info("Данные %s для ИНН %s взяты из устаревшего кэша, обновляю в фоне", source, inn)
+        if (source, inn) not in refreshing:
+            refreshing.add((source, inn))
+            run_in_background(revalidate(source, url, inn))
+    return entry.value
+
+
+async def fetch_cached(session: aiohttp.ClientSession, source: str, url: str, inn: str):
+    """Получение данных источника через кэш."""
+    entry = await result_cache.get(source, inn)
+    if entry is None:
+        CACHE_REQUESTS.inc(source=source, result="miss")
+        return await fetch_and_cache(session, source, url, inn)
+    return serve_cached(entry, source, url, inn)
+
+
+async def stream_service_data(session: aiohttp.ClientSession, source: str, url: str, payload: dict):
+    """Чтение потокового ответа сервиса (NDJSON): события по мере поступления.
 
-        # Отправка результата
-        for attempt in range(3):
-            try:
-                await update.message.reply_text(response)
-                logger.info(f"Запрос для ИНН {inn} успешно обработан за {time.time() - start_time:.2f} секунд")
+    Промежуточные события имеют статус "partial", последнее - "success" или "error".
+    Ответ сервиса без поддержки потока (обычный JSON) приводится к тем же событиям.
+    """
+    inn = payload["inn"]
+    if circuit_open(source, inn):
+        yield {"status": "error", "error": SERVICE_UNAVAILABLE}
+        return
+    breaker = circuit_breakers[source]
+    headers = {REQUEST_ID_HEADER: request_id.get()}
+    try:
+        async with session.post(url, json=payload, headers=headers, timeout=SERVICE_TIMEOUTS[source]) as response:
+            if response.status != 200:
+                logger.error("Ошибка HTTP %s при запросе к %s для ИНН %s", response.status, url, inn)
+                SERVICE_ERRORS.inc(source=source, kind="http")
+                if response.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                yield {"status": "error", "error": f"HTTP {response.status}"}
+                return
+            # Сервис ответил: дальнейшие ошибки поиска - ошибки сайта, а не сервиса
+            breaker.record_success()
+            if response.content_type == "application/json":
+                data = await response.json(loads=loads)
+                validate_response(source, data)
+                if data.get("status") != "success":
+                    yield {"status": "error", "error": data.get("error", "Неизвестная ошибка")}
+                    return
+                cases = data.get("data", {}).get("cases", [])
+                if cases:
+                    yield {"status": "partial", "cases": cases, "page": 1, "pages": 1}
+                yield {"status": "success", "total": len(cases)}
                 return
-            except TimedOut:
-                logger.warning(f"Тайм-аут при отправке результата для ИНН {inn} (попытка {attempt + 1}/3)")
-                await asyncio.sleep(2)
-        logger.error(f"Не удалось отправить результат для ИНН {inn} после 3 попыток")
-        await update.message.reply_text("Ошибка связи с сервером. Пожалуйста, попробуйте снова.")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                event = loads(line)
+                if event.get("status") == "partial":
+                    validate_items(Case, event.get("cases", []))
+                yield event
+                if event.get("status") != "partial":
+                    return
+            logger.error("Поток данных от %s для ИНН %s прерван", url, inn)
+            SERVICE_ERRORS.inc(source=source, kind="network")
+            breaker.record_failure()
+            yield {"status": "error", "error": "Поток данных прерван"}
+    except aiohttp.ClientError as e:
+        logger.error("Ошибка при запросе к %s для ИНН %s: %s", url, inn, e)
+        SERVICE_ERRORS.inc(source=source, kind="network")
+        breaker.record_failure()
+        yield {"status": "error", "error": f"Ошибка сети: {str(e)}"}
+    except asyncio.TimeoutError:
+        logger.error("Тайм-аут при запросе к %s для ИНН %s", url, inn)
+        SERVICE_ERRORS.inc(source=source, kind="timeout")
+        breaker.record_failure()
+        yield {"status": "error", "error": "Тайм-аут запроса"}
+    except ValueError as e:
+        logger.error("Некорректный ответ %s для ИНН %s: %s", url, inn, e)
+        SERVICE_ERRORS.inc(source=source, kind="schema")
+        yield {"status": "error", "error": f"Некорректный ответ сервиса: {str(e)}"}
+    finally:
+        # Поток закрыт до ответа сервиса (отмена задачи): пробный запрос можно повторить
+        breaker.release()
+
+
+async def kad_arbitr_events(session: aiohttp.ClientSession, inn: str):
+    """Дела Кад.арбитр пачками: из кэша или потоком от сервиса по мере загрузки страниц."""
+    entry = await result_cache.get("kad_arbitr", inn)
+    if entry is not None:
+        cases = serve_cached(entry, "kad_arbitr", KAD_ARBITR_URL, inn).get("data", {}).get("cases", [])
+        if cases:
+            yield {"status": "partial", "cases": cases, "page": 1, "pages": 1}
+        yield {"status": "success", "total": len(cases)}
+        return
+
+    # Число дел ограничено KAD_MAX_CASES, поэтому их накопление для кэша не растет без предела
+    CACHE_REQUESTS.inc(source="kad_arbitr", result="miss")
+    collected = []
+    # Время ответа сервиса без времени отправки отчета между событиями потока
+    waited = 0.0
+    payload = {"inn": inn, "stream": True, "max_pages": KAD_MAX_PAGES, "max_cases": KAD_MAX_CASES}
+    async with aclosing(stream_service_data(session, "kad_arbitr", KAD_ARBITR_URL, payload)) as events:
+        started = time.perf_counter()
+        async for event in events:
+            waited += time.perf_counter() - started
+            if event.get("status") == "partial":
+                collected.extend(event.get("cases", []))
+            else:
+                STAGE_SECONDS.observe(waited, source="kad_arbitr", stage="service_fetch")
+            if event.get("status") == "success":
+                data = {"status": "success", "data": {"cases": collected}}
+                await result_cache.set("kad_arbitr", inn, data, negative=not collected)
+                await history.record("kad_arbitr", inn, data)
+            yield event
+            started = time.perf_counter()
+
+
+async def publish(job: Job, blocks: list, continuation: str = None, footer: str = None):
+    """Дописывание частей отчета у всех подписчиков задачи."""
+    job.report_log.append((blocks, continuation))
+    if footer is not None:
+        job.footer = footer
+    results = await asyncio.gather(
+        *(s.renderer.append(blocks, continuation, job.footer) for s in job.subscribers if s.renderer),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error("Ошибка при отправке отчета для ИНН %s: %s", job.inn, result)
 
+
+async def attach_renderer(job: Job, subscriber: Subscriber):
+    """Подключение подписчика к выполняющейся задаче с догоняющим выводом готовой части отчета."""
+    subscriber.renderer = ReportRenderer(subscriber.message, subscriber.status_message)
+    published = 0
+    while published < len(job.report_log):
+        blocks, continuation = job.report_log[published]
+        await subscriber.renderer.append(blocks, continuation, job.footer)
+        published += 1
+    job.subscribers.append(subscriber)
+
+
+async def pump_events(events, queue: asyncio.Queue):
+    """Перекладывание событий потока в очередь, чтобы поток читался параллельно с ЕФРСБ."""
+    try:
+        async with aclosing(events):
+            async for event in events:
+                await queue.put(event)
+    except Exception as e:
+        logger.error("Ошибка при получении данных Кад.арбитр: %s", e, exc_info=True)
+        await queue.put({"status": "error", "error": str(e)})
+
+
+async def process_request(job: Job):
+    """Обработка запроса из очереди: отчет выводится по мере поступления данных от источников.
+
+    Непредвиденная ошибка передается исключением: задача возвращается в очередь для повтора.
+    """
+    inn = job.inn
+    start_time = time.time()
+    logger.info("Начало обработки запроса для ИНН %s от пользователя %s", inn, job.user_id)
+
+    # Сообщение о позиции в очереди становится первым сообщением отчета
+    for subscriber in job.subscribers:
+        subscriber.renderer = ReportRenderer(subscriber.message, subscriber.status_message)
+    kad_task = None
+    try:
+        await publish(job, header_blocks(inn), footer="Загрузка данных ЕФРСБ и Кад.арбитр...")
+        # Параллельные запросы к сервисам: ЕФРСБ целиком, Кад.арбитр - потоком пачек дел
+        efrsb_task = asyncio.create_task(fetch_cached(http_session, "efrsb", EFRSB_URL, inn))
+        kad_queue = asyncio.Queue()
+        kad_task = asyncio.create_task(pump_events(kad_arbitr_events(http_session, inn), kad_queue))
+
+        # Раздел ЕФРСБ выводится сразу, не дожидаясь Кад.арбитр
+        efrsb_data, = await asyncio.gather(efrsb_task, return_exceptions=True)
+        with STAGE_SECONDS.time(source="efrsb", stage="report_build"):
+            blocks = efrsb_blocks(inn, efrsb_data)
+        await publish(job, blocks, footer="Загрузка данных Кад.арбитр...")
+        await publish(job, [kad_title_block()])
+
+        shown = 0
+        while True:
+            event = await kad_queue.get()
+            if event.get("status") != "partial":
+                break
+            cases = event.get("cases", [])
+            with STAGE_SECONDS.time(source="kad_arbitr", stage="report_build"):
+                blocks = case_blocks(cases, shown + 1)
+            if not shown:
+                blocks.insert(0, "- Судебные дела:")
+            shown += len(cases)
+            pages = f" из {event['pages']}" if event.get("pages") else ""
+            await publish(
+                job, blocks,
+                continuation=f"3. Кад.арбитр (продолжение, ИНН: {inn})",
+                footer=f"Загрузка дел Кад.арбитр: страница {event.get('page', 1)}{pages}..."
+            )
+        await publish(job, kad_result_blocks(inn, event, shown, KAD_MAX_CASES) + [closing_block()], footer="")
     except Exception as e:
-        logger.error(f"Критическая ошибка при обработке ИНН {inn}: {str(e)}", exc_info=True)
+        logger.error("Критическая ошибка при обработке ИНН %s: %s", inn, e, exc_info=True)
+        raise
+    finally:
+        # С этого момента новые запросы того же ИНН запускают новый поиск
+        if inflight.get(inn) is job:
+            del inflight[inn]
+        if kad_task is not None:
+            kad_task.cancel()
+
+    REQUEST_SECONDS.observe(time.time() - start_time)
+    logger.info(
+        "Запрос для ИНН %s успешно обработан за %.2f секунд, получателей: %s",
+        inn, time.time() - start_time, len(job.subscribers)
+    )
+
+
+async def job_seconds() -> dict:
+    """Среднее время выполнения задачи по приоритетам: по замерам очереди или оценка по умолчанию."""
+    return {**DEFAULT_JOB_SECONDS, **await request_queue.service_times()}
+
+
+def queue_etas(priorities: list, running: list, seconds: dict) -> list:
+    """Ожидаемое время до готовности отчета для задач с приоритетами priorities (в порядке обслуживания).
+
+    Задачи впереди делят QUEUE_WORKERS воркеров; выполняющиеся задачи в среднем готовы наполовину.
+    """
+    default = DEFAULT_JOB_SECONDS[PRIORITY_INTERACTIVE]
+    backlog = sum(seconds.get(priority, default) for priority in running) / 2
+    etas = []
+    for priority in priorities:
+        etas.append(backlog / QUEUE_WORKERS + seconds.get(priority, default))
+        backlog += seconds.get(priority, default)
+    return etas
+
+
+async def queue_snapshot() -> tuple:
+    """Ожидающие задачи в порядке обслуживания и ожидаемое время до готовности отчета по каждой."""
+    ordered = await request_queue.ordered()
+    etas = queue_etas([priority for _, priority, _ in ordered], await request_queue.running(), await job_seconds())
+    return ordered, etas
+
+
+async def estimate_wait(priority: int) -> float:
+    """Ожидаемое время до готовности отчета для новой задачи: впереди все задачи того же или большего приоритета."""
+    ordered = await request_queue.ordered()
+    ahead = [queued_priority for _, queued_priority, _ in ordered if queued_priority >= priority]
+    return queue_etas(ahead + [priority], await request_queue.running(), await job_seconds())[-1]
+
+
+async def request_priority(inn: str) -> int:
+    """Приоритет запроса: ответы обоих источников есть в кэше - быстрая полоса."""
+    for source in ("efrsb", "kad_arbitr"):
+        if await result_cache.get(source, inn) is None:
+            return PRIORITY_INTERACTIVE
+    return PRIORITY_WARM
+
+
+async def refresh_queue_positions(bot):
+    """Периодическое обновление сообщений с позицией в очереди и ожиданием у ожидающих пользователей.
+
+    Задачи забирают и воркеры других процессов, поэтому позиции перечитываются из очереди.
+    """
+    while True:
+        await asyncio.sleep(POSITIONS_REFRESH_INTERVAL)
         try:
-            await waiting_message.delete()
+            current = {}
+            ordered, etas = await queue_snapshot()
+            for position, ((job_id, _, subscribers), eta) in enumerate(zip(ordered, etas), 1):
+                text = queue_position_text(position, eta)
+                for chat_id, _, status_message_id in subscribers:
+                    if status_message_id is None:
+                        continue
+                    key = (chat_id, status_message_id)
+                    current[key] = text
+                    if shown_statuses.get(key) == text:
+                        continue
+                    try:
+                        await bot.edit_message_text(text, chat_id=chat_id, message_id=status_message_id)
+                    except Exception as e:
+                        logger.warning("Не удалось обновить позицию в очереди для задачи %s: %s", job_id, e)
+            shown_statuses.clear()
+            shown_statuses.update(current)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.warning(f"Ошибка при удалении сообщения об ожидании для ИНН {inn}: {str(e)}")
+            logger.error("Ошибка при обновлении позиций в очереди: %s", e, exc_info=True)
+
+
+def run_in_background(coro):
+    """Запуск фоновой задачи с сохранением ссылки на нее до завершения."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def job_from_queue(queued: QueuedJob, bot) -> Job:
+    """Задача для обработки: получатели восстанавливаются по идентификаторам чатов и сообщений."""
+    subscribers = [
+        Subscriber(
+            message=MessageRef(bot, chat_id, message_id),
+            status_message=MessageRef(bot, chat_id, status_message_id) if status_message_id else None,
+        )
+        for chat_id, message_id, status_message_id in queued.subscribers
+    ]
+    chat_id, message_id, _ = queued.subscribers[0]
+    return Job(id=queued.id, inn=queued.inn, user_id=queued.user_id, subscribers=subscribers,
+               attempts=queued.attempts, enqueued_at=queued.enqueued_at,
+               request_id=message_request_id(chat_id, message_id))
+
+
+async def keep_lease(job: Job):
+    """Продление аренды задачи, пока она выполняется."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_TIMEOUT / 3)
         try:
-            await update.message.reply_text(f"Произошла ошибка: {str(e)}. Пожалуйста, попробуйте снова.")
-        except TimedOut:
-            logger.warning(f"Тайм-аут при отправке сообщения об ошибке для ИНН {inn}")
-            await asyncio.sleep(2)
-            await update.message.reply_text(f"Произошла ошибка: {str(e)}. Пожалуйста, попробуйте снова.")
+            await request_queue.extend(job.id)
+        except Exception as e:
+            logger.warning("Не удалось продлить аренду задачи %s: %s", job.id, e)
+
+
+async def run_job(job: Job):
+    """Выполнение задачи с подтверждением в очереди или возвратом на повтор при ошибке."""
+    lease_task = asyncio.create_task(keep_lease(job))
+    WORKERS_BUSY.inc()
+    start_time = time.time()
+    try:
+        await process_request(job)
+        await request_queue.ack(job.id, time.time() - start_time)
+        JOBS.inc(result="success")
+    except asyncio.CancelledError:
+        # Воркер остановлен: задача возвращается в очередь без учета попытки
+        await request_queue.release(job.id)
+        raise
+    except Exception as e:
+        retry = await request_queue.nack(job.id, str(e))
+        JOBS.inc(result="retry" if retry else "dead")
+        if retry:
+            delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning("Задача %s для ИНН %s будет повторена через %s секунд", job.id, job.inn, delay)
+            text = f"Произошла ошибка: {str(e)}. Повторная попытка через {delay} секунд."
+        else:
+            logger.error("Задача %s для ИНН %s не выполнена за %s попыток", job.id, job.inn, job.attempts)
+            text = f"Произошла ошибка: {str(e)}. Пожалуйста, попробуйте снова."
+        await publish(job, [text], footer="")
+    finally:
+        WORKERS_BUSY.dec()
+        lease_task.cancel()
 
 
-async def worker(context: ContextTypes.DEFAULT_TYPE):
+async def worker(worker_id: int, bot):
     """Фоновая задача для обработки очереди запросов."""
+    name = f"{os.getpid()}-{worker_id}"
     while True:
         try:
             # Получаем задачу из очереди
-            inn, update = await request_queue.get()
-            logger.info(f"Воркер взял запрос для ИНН {inn} от пользователя {update.effective_user.id}")
-            await process_request(inn, update, context)
-            request_queue.task_done()
+            job = job_from_queue(await request_queue.get(name), bot)
+            QUEUE_WAIT.observe(time.time() - job.enqueued_at)
+            # Задачи, созданные внутри (запросы к сервисам, фоновое обновление кэша), наследуют идентификатор
+            with request_context(job.request_id):
+                logger.info(
+                    "Воркер %s взял запрос для ИНН %s от пользователя %s (ожидание %.2f секунд, попытка %s)",
+                    name, job.inn, job.user_id, time.time() - job.enqueued_at, job.attempts
+                )
+                inflight[job.inn] = job
+                await run_job(job)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка в воркере: {str(e)}", exc_info=True)
+            logger.error("Ошибка в воркере %s: %s", name, e, exc_info=True)
             await asyncio.sleep(2)
 
 
+async def send_queue_status(update: Update, job_id: int):
+    """Сообщение с позицией в очереди и ожиданием отчета; с него начнется отчет."""
+    ordered, etas = await queue_snapshot()
+    ids = [queued_id for queued_id, _, _ in ordered]
+    # Задачу уже мог взять воркер
+    position = ids.index(job_id) + 1 if job_id in ids else 1
+    eta = etas[position - 1] if job_id in ids else (await job_seconds())[PRIORITY_INTERACTIVE]
+    text = queue_position_text(position, eta)
+    try:
+        status_message = await update.message.reply_text(text)
+    except TimedOut:
+        logger.warning("Тайм-аут при отправке уведомления о постановке в очередь задачи %s", job_id)
+        await asyncio.sleep(2)
+        status_message = await update.message.reply_text(text)
+    shown_statuses[(update.effective_chat.id, status_message.message_id)] = text
+    await request_queue.set_status_message(
+        job_id, update.effective_chat.id, update.message.message_id, status_message.message_id
+    )
+    return position
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений."""
+    with request_context(message_request_id(update.effective_chat.id, update.message.message_id)):
+        await accept_request(update)
+
+
+async def accept_request(update: Update):
+    """Проверка ИНН и постановка запроса в очередь (или присоединение к задаче по тому же ИНН)."""
     user_id = update.effective_user.id
     inn = update.message.text.strip()
-    logger.info(f"Получено сообщение от пользователя {user_id}: ИНН {inn}")
+    logger.info("Получено сообщение от пользователя %s: ИНН %s", user_id, inn)
 
     # Валидация ИНН
     if not re.match(r'^\d{10}$|^\d{12}$', inn):
-        logger.warning(f"Некорректный ИНН {inn} от пользователя {user_id}")
+        logger.warning("Некорректный ИНН %s от пользователя %s", inn, user_id)
         try:
             await update.message.reply_text("Ошибка: ИНН должен содержать 10 или 12 цифр.")
             return
         except TimedOut:
-            logger.warning(f"Тайм-аут при отправке ошибки валидации ИНН {inn} для пользователя {user_id}")
+            logger.warning("Тайм-аут при отправке ошибки валидации ИНН %s для пользователя %s", inn, user_id)
             await asyncio.sleep(2)
             await update.message.reply_text("Ошибка: ИНН должен содержать 10 или 12 цифр.")
             return
 
-    # Ограничение размера очереди
-    if request_queue.qsize() >= 10:
-        logger.warning(f"Очередь переполнена для ИНН {inn} от пользователя {user_id}")
+    chat_id = update.effective_chat.id
+    message_id = update.message.message_id
+
+    # Присоединение к уже идущему в этом процессе поиску по тому же ИНН
+    job = inflight.get(inn)
+    if job is not None:
+        subscriber = Subscriber(message=update.message)
+        logger.info("Запрос для ИНН %s от пользователя %s присоединен к выполняющейся задаче", inn, user_id)
+        subscriber.status_message = await update.message.reply_text(
+            "Поиск по этому ИНН уже выполняется. Результат придет автоматически."
+        )
+        # Получатель сохраняется в очереди: при повторе задачи после ошибки отчет придет и ему
+        if await request_queue.subscribe(job.id, chat_id, message_id, leased=True):
+            await request_queue.set_status_message(job.id, chat_id, message_id, subscriber.status_message.message_id)
+        # Уже выведенная часть отчета показывается сразу, остальное - по мере поступления
+        await attach_renderer(job, subscriber)
+        return
+
+    # Присоединение к ожидающей в очереди задаче по тому же ИНН
+    job_id = await request_queue.find_queued(inn)
+    if job_id is not None and await request_queue.subscribe(job_id, chat_id, message_id):
+        logger.info("Запрос для ИНН %s от пользователя %s присоединен к задаче %s в очереди", inn, user_id, job_id)
+        await send_queue_status(update, job_id)
+        return
+
+    # Допуск в очередь: лимит пользователя и ожидаемое время до готовности отчета
+    priority = await request_priority(inn)
+    wait = None
+    try:
+        if await request_queue.user_qsize(user_id) >= MAX_USER_QUEUE:
+            raise asyncio.QueueFull("user_limit")
+        wait = await estimate_wait(priority)
+        if wait > MAX_QUEUE_WAIT:
+            raise asyncio.QueueFull("wait")
+        job_id = await request_queue.put(inn, user_id, chat_id, message_id, priority)
+    except asyncio.QueueFull as e:
+        reason = e.args[0] if e.args else "queue_size"
+        REJECTED_REQUESTS.inc(reason=reason)
+        logger.warning("Очередь переполнена для ИНН %s от пользователя %s (%s)", inn, user_id, reason)
         try:
-            await update.message.reply_text("Очередь переполнена. Пожалуйста, попробуйте позже.")
+            await update.message.reply_text(queue_full_text(wait))
             return
         except TimedOut:
-            logger.warning(f"Тайм-аут при отправке сообщения о переполнении очереди для ИНН {inn}")
+            logger.warning("Тайм-аут при отправке сообщения о переполнении очереди для ИНН %s", inn)
             await asyncio.sleep(2)
-            await update.message.reply_text("Очередь переполнена. Пожалуйста, попробуйте позже.")
+            await update.message.reply_text(queue_full_text(wait))
+            return
+
+    position = await send_queue_status(update, job_id)
+    logger.info(
+        "Запрос для ИНН %s добавлен в очередь (задача %s, приоритет %s). Позиция: %s, ожидание: %.0f секунд",
+        inn, job_id, priority, position, wait
+    )
+
+
+async def yield_to_queue():
+    """Ожидание перед пакетом массовой проверки, пока в очереди есть одиночные запросы."""
+    deadline = time.monotonic() + BULK_YIELD_MAX_WAIT
+    while time.monotonic() < deadline and await request_queue.qsize():
+        await asyncio.sleep(1)
+
+
+async def run_bulk(update: Update, status_message, inns: list):
+    """Массовая проверка ИНН из файла пользователя с отправкой сводки по завершении."""
+    user_id = update.effective_user.id
+    # Имя сводки зависит от списка ИНН: повторная отправка того же файла продолжает прерванную проверку
+    csv_path = os.path.join(BULK_DIR, f"bulk_{user_id}_{inns_digest(inns)}.csv")
+    last_progress = 0.0
+
+    async def progress(done: int, total: int):
+        nonlocal last_progress
+        if done < total and time.monotonic() - last_progress < BULK_PROGRESS_INTERVAL:
             return
+        last_progress = time.monotonic()
+        try:
+            await status_message.edit_text(f"Массовая проверка: готово {done} из {total}")
+        except Exception as e:
+            logger.warning("Не удалось обновить ход массовой проверки для пользователя %s: %s", user_id, e)
 
-    # Добавление запроса в очередь
-    await request_queue.put((inn, update))
-    queue_size = request_queue.qsize()
-    logger.info(f"Запрос для ИНН {inn} добавлен в очередь. Размер очереди: {queue_size}")
+    bulk_users.add(user_id)
+    start_time = time.time()
     try:
+        os.makedirs(BULK_DIR, exist_ok=True)
+        stats = await BulkRun(http_session, inns, csv_path, EFRSB_URL, KAD_ARBITR_URL, progress,
+                              before_chunk=yield_to_queue, overwrite=True).run()
+        path = csv_path
+        if XLSX_AVAILABLE:
+            path = f"{os.path.splitext(csv_path)[0]}.xlsx"
+            await asyncio.to_thread(write_xlsx, csv_path, path)
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                f, filename=f"inn_summary{os.path.splitext(path)[1]}",
+                caption=f"Проверено ИНН: {stats['done']}, с ошибками: {stats['errors']}"
+            )
+        # Сводка доставлена: повторная отправка того же списка запустит новую проверку
+        remove_bulk_files(csv_path, path)
+        logger.info(
+            "Массовая проверка для пользователя %s завершена: ИНН %s, ошибок %s, время %.2f секунд",
+            user_id, stats['total'], stats['errors'], time.time() - start_time
+        )
+    except Exception as e:
+        logger.error("Ошибка массовой проверки для пользователя %s: %s", user_id, e, exc_info=True)
         await update.message.reply_text(
-            f"Ваш запрос принят. В очереди {queue_size} запрос(ов). Пожалуйста, ожидайте."
+            f"Массовая проверка прервана: {str(e)}. Отправьте тот же файл еще раз, чтобы продолжить."
         )
-    except TimedOut:
-        logger.warning(f"Тайм-аут при отправке уведомления о постановке в очередь для ИНН {inn}")
-        await asyncio.sleep(2)
+    finally:
+        bulk_users.discard(user_id)
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик файлов со списком ИНН для массовой проверки."""
+    user_id = update.effective_user.id
+    document = update.message.document
+    logger.info("Получен файл %s от пользователя %s", document.file_name, user_id)
+    if user_id in bulk_users:
+        await update.message.reply_text("Массовая проверка уже выполняется. Дождитесь ее завершения.")
+        return
+    if document.file_size and document.file_size > BULK_MAX_FILE_SIZE:
+        await update.message.reply_text("Файл слишком большой. Максимальный размер - 1 МБ.")
+        return
+
+    telegram_file = await document.get_file()
+    inns, invalid = parse_inns(decode_upload(bytes(await telegram_file.download_as_bytearray())))
+    if not inns:
+        await update.message.reply_text("В файле не найдено ни одного корректного ИНН.")
+        return
+    if len(inns) > BULK_MAX_INNS:
+        await update.message.reply_text(f"Слишком много ИНН: {len(inns)}. Максимум - {BULK_MAX_INNS}.")
+        return
+
+    skipped = f", некорректных пропущено: {len(invalid)}" if invalid else ""
+    status_message = await update.message.reply_text(
+        f"Принято ИНН: {len(inns)}{skipped}. Массовая проверка запущена, сводка придет файлом."
+    )
+    logger.info("Массовая проверка для пользователя %s: ИНН %s, некорректных %s", user_id, len(inns), len(invalid))
+    # Фоновая задача наследует идентификатор запроса для логов бота и сервисов
+    with request_context(message_request_id(update.effective_chat.id, update.message.message_id)):
+        run_in_background(run_bulk(update, status_message, inns))
+
+
+def changes_text(inn: str, changes: dict) -> str:
+    """Уведомление подписчику о новых делах и изменениях статусов ЕФРСБ."""
+    lines = [f"Изменения по ИНН {inn}:"]
+    for name, status, previous_status, status_date, court_case_number, is_new in changes["bankruptcies"]:
+        case = f", дело {court_case_number}" if court_case_number else ""
+        if is_new:
+            lines.append(f"- ЕФРСБ: новая запись: {name or 'Неизвестно'}, статус: {status}{case}")
+        else:
+            lines.append(f"- ЕФРСБ: статус изменен: {previous_status} -> {status} ({status_date}){case}")
+    for case_number, registration_date, plaintiff, respondent in changes["cases"]:
+        lines.append(
+            f"- Кад.арбитр: новое дело {case_number} от {registration_date or 'Неизвестно'}: "
+            f"{plaintiff or 'Неизвестно'} против {respondent or 'Неизвестно'}"
+        )
+    return "\n".join(lines)
+
+
+async def check_watched_inn(bot, inn: str, watches: list):
+    """Проверка ИНН по подпискам: обновление истории и уведомление о найденных изменениях."""
+    efrsb_data, kad_data = await asyncio.gather(
+        fetch_and_cache(http_session, "efrsb", EFRSB_URL, inn),
+        fetch_and_cache(http_session, "kad_arbitr", KAD_ARBITR_URL, inn),
+    )
+    checked_at = time.time()
+    if not any(isinstance(data, dict) and data.get("status") == "success" for data in (efrsb_data, kad_data)):
+        logger.warning("Проверка подписки на ИНН %s не удалась, повтор через %s секунд", inn, WATCH_RETRY_INTERVAL)
+        for chat_id, _ in watches:
+            await history.mark_checked(chat_id, inn, None, checked_at + WATCH_RETRY_INTERVAL)
+        return
+    for chat_id, last_checked in watches:
+        # Первая проверка только фиксирует текущее состояние
+        if last_checked is not None:
+            changes = await history.changes_since(inn, last_checked)
+            if changes["cases"] or changes["bankruptcies"]:
+                logger.info("Изменения по ИНН %s для чата %s: дел %s, записей ЕФРСБ %s",
+                            inn, chat_id, len(changes['cases']), len(changes['bankruptcies']))
+                try:
+                    for part in split_block(changes_text(inn, changes), TELEGRAM_MESSAGE_LIMIT):
+                        await bot.send_message(chat_id, part)
+                except Exception as e:
+                    logger.error("Не удалось отправить уведомление по ИНН %s в чат %s: %s", inn, chat_id, e)
+                    continue
+        await history.mark_checked(chat_id, inn, checked_at, checked_at + WATCH_INTERVAL)
+
+
+async def check_watches(bot):
+    """Периодическая проверка подписок; ИНН, на который подписаны несколько чатов, проверяется один раз."""
+    while True:
+        try:
+            due = {}
+            for chat_id, inn, last_checked in await history.due_watches():
+                due.setdefault(inn, []).append((chat_id, last_checked))
+            for inn, watches in due.items():
+                with request_context(f"watch:{inn}"):
+                    await check_watched_inn(bot, inn, watches)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Ошибка при проверке подписок: %s", e, exc_info=True)
+        await asyncio.sleep(WATCH_POLL_INTERVAL)
+
+
+async def watch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /watch <ИНН>: подписка на новые дела и изменения статусов."""
+    user_id = update.effective_user.id
+    if len(context.args) != 1 or not is_valid_inn(context.args[0]):
+        await update.message.reply_text("Использование: /watch <ИНН> (10 или 12 цифр с верными контрольными цифрами)")
+        return
+    inn = context.args[0]
+    if not await history.add_watch(update.effective_chat.id, user_id, inn, WATCH_MAX_PER_CHAT):
         await update.message.reply_text(
-            f"Ваш запрос принят. В очереди {queue_size} запрос(ов). Пожалуйста, ожидайте."
+            f"Достигнут лимит подписок: {WATCH_MAX_PER_CHAT}. Отмените лишние через /unwatch."
         )
+        return
+    logger.info("Пользователь %s подписался на изменения по ИНН %s", user_id, inn)
+    await update.message.reply_text(
+        f"Подписка на ИНН {inn} оформлена. Я сообщу о новых делах Кад.арбитр и изменениях статусов в ЕФРСБ."
+    )
+
+
+async def unwatch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /unwatch <ИНН>."""
+    if len(context.args) != 1:
+        await update.message.reply_text("Использование: /unwatch <ИНН>")
+        return
+    if await history.remove_watch(update.effective_chat.id, context.args[0]):
+        await update.message.reply_text(f"Подписка на ИНН {context.args[0]} отменена.")
+    else:
+        await update.message.reply_text(f"Подписки на ИНН {context.args[0]} нет.")
+
+
+async def list_watches(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /watches: список подписок чата."""
+    watches = await history.list_watches(update.effective_chat.id)
+    if not watches:
+        await update.message.reply_text("Подписок нет. Оформить: /watch <ИНН>")
+        return
+    lines = [
+        f"- {inn}: " + (time.strftime('проверен %d.%m.%Y %H:%M', time.localtime(last_checked))
+                        if last_checked else "ожидает первой проверки")
+        for inn, last_checked in watches
+    ]
+    await update.message.reply_text("Подписки:\n" + "\n".join(lines))
+
+
+async def collect_queue_depth():
+    QUEUE_DEPTH.set(await request_queue.qsize())
+
+
+async def start_workers(bot):
+    """Создание общей HTTP-сессии, сервера метрик и пула воркеров (в боте или в процессе worker.py)."""
+    global http_session, metrics_runner
+    http_session = create_http_session()
+    # Задачи, сохраненные до появления приоритетов (priority = 0), обслуживаются как одиночные запросы
+    migrated = await request_queue.raise_priorities(PRIORITY_INTERACTIVE)
+    if migrated:
+        logger.info("Задачам прежних версий назначен приоритет одиночного запроса: %s", migrated)
+    if METRICS_PORT:
+        REGISTRY.add_collector(collect_queue_depth)
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    WORKERS_TOTAL.set(WORKERS_COUNT)
+    for worker_id in range(1, WORKERS_COUNT + 1):
+        worker_tasks.append(asyncio.create_task(worker(worker_id, bot)))
+    logger.info("Запущено воркеров: %s, допустимое ожидание в очереди: %s секунд", WORKERS_COUNT, MAX_QUEUE_WAIT)
+
+
+async def stop_workers():
+    """Остановка воркеров и фоновых задач, закрытие HTTP-сессии, кэша и очереди."""
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+    # Фоновые задачи используют общую сессию - завершаем их до ее закрытия
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if http_session is not None:
+        await http_session.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    result_cache.close()
+    request_queue.close()
+    history.close()
+
+
+async def on_startup(application):
+    """Запуск воркеров и обновления позиций в очереди после инициализации приложения."""
+    await start_workers(application.bot)
+    run_in_background(refresh_queue_positions(application.bot))
+    run_in_background(check_watches(application.bot))
+
+
+async def on_shutdown(application):
+    """Остановка воркеров при завершении работы бота."""
+    await stop_workers()
 
 
 def main():
     """Запуск Telegram-бота."""
+    setup_logging(os.getenv('LOG_FILE', 'bot.log'))
     try:
-        application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+        application = (
+            ApplicationBuilder()
+            .token(TELEGRAM_TOKEN)
+            .post_init(on_startup)
+            .post_shutdown(on_shutdown)
+            .build()
+        )
         application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("watch", watch))
+        application.add_handler(CommandHandler("unwatch", unwatch))
+        application.add_handler(CommandHandler("watches", list_watches))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-        # Запуск воркера
-        loop = asyncio.get_event_loop()
-        loop.create_task(worker(application.context_types.context))
+        application.add_handler(MessageHandler(
+            filters.Document.FileExtension("txt") | filters.Document.FileExtension("csv"), handle_document
+        ))
 
         logger.info("Запуск бота...")
         print("Бот запущен")
@@ -270,7 +1171,7 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         logger.info("Остановка бота...")
     except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {str(e)}", exc_info=True)
+        logger.error("Ошибка при запуске бота: %s", e, exc_info=True)
         print(f"Ошибка при запуске бота: {str(e)}")
         exit(1)
 
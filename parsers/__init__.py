@@ -1,2 +1,7 @@
-from .efrsb_parser import get_info_efrsb
-from .kad_arbitr_parser import get_info_kad_arbitr
\ No newline at end of file
+from .browser import BrowserManager, get_browser_manager, close_browser_managers
+from .extract import shutdown_extraction_pool
+from .models import Case, Individual, LegalEntity, dumps, loads, validate_items
+from .timing import add_step_observer
+from .rate_limiter import AdaptiveRateLimiter, get_rate_limiter, rate_limiter_stats
+from .efrsb_parser import get_info_efrsb, search_efrsb
+from .kad_arbitr_parser import KadArbitrError, get_info_kad_arbitr, iter_kad_arbitr_cases, search_kad_arbitr
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright, Error as PlaywrightError
+
+from .timing import step_timer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CDP_ENDPOINT = "http://localhost:9222"
+
+# Максимальное число одновременно открытых вкладок на один браузер
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', 4))
+# Попытки подключения к CDP при старте или перезапуске Chrome
+CONNECT_ATTEMPTS = 3
+# Тайм-аут проверки "живости" вкладки перед повторным использованием, секунды
+HEALTH_CHECK_TIMEOUT = 2
+
+
+class BrowserManager:
+    """Долгоживущее подключение к Chrome по CDP с пулом прогретых вкладок.
+
+    Вкладки не закрываются после запроса, а возвращаются в пул с меткой сайта,
+    чтобы следующий запрос к тому же сайту получил уже прогретую вкладку.
+    При перезапуске Chrome подключение восстанавливается при следующем запросе.
+    """
+
+    def __init__(self, cdp_endpoint: str = DEFAULT_CDP_ENDPOINT, max_pages: int = BROWSER_MAX_PAGES):
+        self.cdp_endpoint = cdp_endpoint
+        self.max_pages = max_pages
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_pages)
+        self._idle = []
+
+    @property
+    def connected(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def _ensure_browser(self):
+        """Подключение к браузеру, если соединения нет или оно потеряно."""
+        async with self._lock:
+            if self.connected:
+                return self._browser
+            self._browser = None
+            self._idle.clear()
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            for attempt in range(1, CONNECT_ATTEMPTS + 1):
+                try:
+                    logger.info("Подключение к CDP по адресу: %s (попытка %s)", self.cdp_endpoint, attempt)
+                    with step_timer("browser", "cdp_connect"):
+                        browser = await self._playwright.chromium.connect_over_cdp(self.cdp_endpoint)
+                    browser.on("disconnected", self._on_disconnected)
+                    self._browser = browser
+                    return browser
+                except PlaywrightError as e:
+                    logger.warning("Не удалось подключиться к CDP %s: %s", self.cdp_endpoint, e)
+                    if attempt == CONNECT_ATTEMPTS:
+                        raise
+                    await asyncio.sleep(attempt)
+
+    def _on_disconnected(self, browser):
+        if browser is self._browser:
+            logger.warning("Соединение с браузером %s потеряно", self.cdp_endpoint)
+            self._browser = None
+            self._idle.clear()
+
+    async def _is_healthy(self, page) -> bool:
+        if page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(page.evaluate("1"), HEALTH_CHECK_TIMEOUT)
+            return True
+        except (PlaywrightError, asyncio.TimeoutError):
+            return False
+
+    async def _close_page(self, page):
+        try:
+            if not page.is_closed():
+                await page.close()
+        except PlaywrightError as e:
+            logger.warning("Ошибка при закрытии вкладки: %s", e)
+
+    async def _acquire_page(self, key: str):
+        browser = await self._ensure_browser()
+        while self._idle:
+            # Предпочитаем вкладку, уже открытую на том же сайте
+            index = next((i for i, (idle_key, _) in enumerate(self._idle) if idle_key == key), -1)
+            _, page = self._idle.pop(index)
+            if await self._is_healthy(page):
+                return page
+            await self._close_page(page)
+        context = browser.contexts[0] if browser.contexts else await browser.new_context()
+        return await context.new_page()
+
+    @asynccontextmanager
+    async def page(self, key: str = "default"):
+        """Выдача вкладки из пула на время запроса."""
+        async with self._slots:
+            page = await self._acquire_page(key)
+            broken = True
+            try:
+                yield page
+                broken = False
+            finally:
+                if broken or not self.connected or page.is_closed():
+                    await self._close_page(page)
+                else:
+                    self._idle.append((key, page))
+
+    async def close(self):
+        """Закрытие вкладок пула и отключение от браузера."""
+        async with self._lock:
+            for _, page in self._idle:
+                await self._close_page(page)
+            self._idle.clear()
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except PlaywrightError as e:
+                    logger.warning("Ошибка при отключении от браузера: %s", e)
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+_managers = {}
+
+
+def get_browser_manager(cdp_endpoint: str = DEFAULT_CDP_ENDPOINT) -> BrowserManager:
+    """Общий менеджер браузера для заданного CDP-адреса."""
+    manager = _managers.get(cdp_endpoint)
+    if manager is None:
+        manager = _managers[cdp_endpoint] = BrowserManager(cdp_endpoint)
+    return manager
+
+
+async def close_browser_managers():
+    """Закрытие всех подключений к браузерам (при остановке процесса)."""
+    for manager in list(_managers.values()):
+        await manager.close()
+    _managers.clear()
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from playwright.async_api import Error as PlaywrightError
+
+logger = logging.getLogger(__name__)
+
+# Отладочное сохранение HTML-страниц включается заданием каталога
+DEBUG_DUMP_DIR = os.getenv('PARSER_DEBUG_DIR')
+# Ограничения на размер одного файла и число хранимых файлов
+DEBUG_DUMP_MAX_BYTES = int(os.getenv('PARSER_DEBUG_MAX_BYTES', 2 * 1024 * 1024))
+DEBUG_DUMP_MAX_FILES = int(os.getenv('PARSER_DEBUG_MAX_FILES', 50))
+
+
+def _write_dump(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    # Удаление самых старых файлов сверх лимита
+    dumps = sorted(
+        (entry for entry in os.scandir(os.path.dirname(path)) if entry.name.endswith(".html")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in dumps[:max(len(dumps) - DEBUG_DUMP_MAX_FILES, 0)]:
+        os.remove(entry.path)
+
+
+async def save_debug_html(prefix: str, inn: str, content: str):
+    """Сохранение HTML-кода в отладочный каталог, если он задан. Возвращает путь к файлу."""
+    if not DEBUG_DUMP_DIR or not content:
+        return None
+    data = content.encode("utf-8")[:DEBUG_DUMP_MAX_BYTES]
+    name = f"{prefix}_{inn}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}.html"
+    path = os.path.join(DEBUG_DUMP_DIR, name)
+    try:
+        await asyncio.to_thread(_write_dump, path, data)
+        logger.info("HTML-код страницы сохранен в %s для отладки", path)
+        return path
+    except OSError as e:
+        logger.error("Ошибка при сохранении отладочного HTML-кода для ИНН %s: %s", inn, e)
+        return None
+
+
+async def save_page_debug_html(prefix: str, inn: str, page):
+    """Сохранение текущего HTML-кода вкладки (например, после ошибки)."""
+    if not DEBUG_DUMP_DIR:
+        return None
+    try:
+        content = await page.content()
+    except PlaywrightError as e:
+        logger.error("Ошибка при получении HTML-кода для ИНН %s: %s", inn, e)
+        return None
+    return await save_debug_html(prefix, inn, content)
@@ -1,123 +1,166 @@
 import asyncio
 import logging
 import re
-import json
 import os
-from playwright.async_api import async_playwright, Error as PlaywrightError
-from bs4 import BeautifulSoup
-
-# Настройка минимального логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+from .browser import DEFAULT_CDP_ENDPOINT, get_browser_manager
+from .debug import save_debug_html, save_page_debug_html
+from .extract import extract_efrsb, run_extraction
+from .models import Individual, LegalEntity, dumps
+from .rate_limiter import get_rate_limiter
+from .timing import step_timer
+
 logger = logging.getLogger(__name__)
 
-# Подавление HTTP-логов
-logging.getLogger('httpx').setLevel(logging.WARNING)
+HOST = "bankrot.fedresurs.ru"
+BASE_URL = f"https://{HOST}"
+# JSON-эндпоинты, которыми SPA получает результаты поиска: (раздел результата, путь)
+API_SEARCHES = (
+    ("legal_entities", "/backend/cmpbankrupts"),
+    ("individuals", "/backend/prsnbankrupts"),
+)
+API_PAGE_LIMIT = 15
+# Режим получения данных: api - только JSON-эндпоинты, dom - только разбор страницы,
+# auto - JSON-эндпоинты с переходом на разбор страницы при ошибке
+EFRSB_MODE = os.getenv('EFRSB_MODE', 'auto')
+
+# Запрос выполняется из контекста вкладки, поэтому использует ее cookies и анти-бот токены
+FETCH_JSON_SCRIPT = """async (url) => {
+    const response = await fetch(url, {credentials: 'include', headers: {'Accept': 'application/json'}});
+    if (!response.ok) {
+        throw new Error('HTTP ' + response.status);
+    }
+    return await response.json();
+}"""
+
+# Признаки того, что Angular-приложение отрисовало результат поиска
+RESULT_SELECTOR = "div.u-card-result, div.no-result-msg__header"
+NO_RESULTS_MARKER = "no-result-msg__header"
+# Верхняя граница ожидания загрузки страницы и результатов, мс
+PAGE_TIMEOUT = 15000
+RESULT_TIMEOUT = 10000
+
+
+def _format_date(value) -> str:
+    """Перевод даты из ISO-формата API в формат, отображаемый на сайте."""
+    match = re.match(r'^(\d{4})-(\d{2})-(\d{2})', value or '')
+    return f"{match.group(3)}.{match.group(2)}.{match.group(1)}" if match else (value or '')
+
+
+def _map_api_item(section: str, item: dict):
+    """Приведение записи JSON-ответа к той же модели, что дает разбор карточек."""
+    if section == "legal_entities":
+        entry = LegalEntity(name=item.get('name') or '', ogrn=item.get('ogrn') or '')
+    else:
+        entry = Individual(full_name=item.get('fio') or item.get('name') or '', snils=item.get('snils') or '')
+    entry.address = item.get('address') or ''
+    entry.inn = item.get('inn') or ''
+    legal_case = item.get('lastLegalCase') or {}
+    status = legal_case.get('status') or {}
+    entry.status = status.get('description') or ''
+    entry.status_date = _format_date(status.get('date'))
+    entry.court_case_number = legal_case.get('number') or None
+    entry.arbitration_manager = legal_case.get('arbitrManagerFio') or None
+    return entry
+
 
-async def get_info_efrsb(inn: str, cdp_endpoint="http://localhost:9222") -> str:
-    """Получение данных с ЕФРСБ через сохранение и парсинг HTML-файла."""
-    url = f"https://bankrot.fedresurs.ru/bankrupts?searchString={inn}"
-    html_file = f"page_{inn}.html"
-    async with async_playwright() as p:
+async def _search_api(page, inn: str) -> dict:
+    """Поиск через JSON-эндпоинты ЕФРСБ из контекста вкладки браузера."""
+    limiter = get_rate_limiter(HOST)
+    if not page.url.startswith(BASE_URL):
+        # Загрузка сайта нужна, чтобы получить cookies и токены анти-бот защиты
+        with step_timer("efrsb", "page_goto", inn):
+            async with limiter.request():
+                await page.goto(BASE_URL, wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+    result = {"legal_entities": [], "individuals": []}
+    for section, path in API_SEARCHES:
+        url = f"{BASE_URL}{path}?searchString={inn}&isActiveLegalCase=null&limit={API_PAGE_LIMIT}&offset=0"
+        async with limiter.request():
+            data = await page.evaluate(FETCH_JSON_SCRIPT, url)
+            if not isinstance(data, dict) or not isinstance(data.get('pageData'), list):
+                raise ValueError(f"Неожиданный формат ответа {path}")
+        result[section] = [_map_api_item(section, item) for item in data['pageData']]
+    return result
+
+
+async def search_efrsb(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT, mode: str = EFRSB_MODE) -> dict:
+    """Получение данных с ЕФРСБ через JSON-эндпоинты или разбор страницы.
+
+    Возвращает словарь {"legal_entities": [...], "individuals": [...]} или {"error": ...}.
+    """
+    if mode in ("api", "auto"):
         try:
-            logger.info(f"Подключение к CDP по адресу: {cdp_endpoint}")
-            browser = await p.chromium.connect_over_cdp(cdp_endpoint)
-            page = await browser.contexts[0].new_page()
+            async with get_browser_manager(cdp_endpoint).page("efrsb") as page:
+                with step_timer("efrsb", "api_search", inn):
+                    result = await _search_api(page, inn)
+            logger.info("Данные ЕФРСБ для ИНН %s получены через API", inn)
+            return result
+        except (PlaywrightError, ValueError) as e:
+            if mode == "api":
+                logger.error("Ошибка API ЕФРСБ для ИНН %s: %s", inn, e)
+                return {"error": f"Ошибка API: {str(e)}"}
+            logger.warning("API ЕФРСБ недоступно для ИНН %s, перехожу к разбору страницы: %s", inn, e)
+    return await _search_efrsb_dom(inn, cdp_endpoint)
+
+
+async def get_info_efrsb(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT, mode: str = EFRSB_MODE) -> str:
+    """Получение данных с ЕФРСБ в виде компактной JSON-строки."""
+    return dumps(await search_efrsb(inn, cdp_endpoint, mode)).decode("utf-8")
+
 
+async def _search_efrsb_dom(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT) -> dict:
+    """Получение данных с ЕФРСБ через разбор HTML-кода страницы в памяти."""
+    url = f"{BASE_URL}/bankrupts?searchString={inn}"
+    limiter = get_rate_limiter(HOST)
+    try:
+        async with get_browser_manager(cdp_endpoint).page("efrsb") as page:
             try:
-                logger.info(f"Загружаю страницу ЕФРСБ: {url}")
-                await page.goto(url, wait_until="networkidle")
-                # Ожидание 3 секунды для рендеринга Angular-приложения
-                await page.wait_for_timeout(3000)
+                logger.info("Загружаю страницу ЕФРСБ: %s", url)
+                with step_timer("efrsb", "page_goto", inn):
+                    async with limiter.request():
+                        await page.goto(url, wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+                # Ожидание отрисовки карточек или сообщения об отсутствии результатов
+                with step_timer("efrsb", "result_wait", inn):
+                    try:
+                        await page.wait_for_selector(RESULT_SELECTOR, timeout=RESULT_TIMEOUT)
+                    except PlaywrightTimeoutError:
+                        # Неотрисованная страница - не "ничего не найдено": иначе пустой ответ попадет в кэш
+                        logger.error("Результаты ЕФРСБ для ИНН %s не появились за %s мс", inn, RESULT_TIMEOUT)
+                        limiter.record_failure("timeout")
+                        await save_page_debug_html("efrsb", inn, page)
+                        return {"error": f"Результаты не загрузились за {RESULT_TIMEOUT} мс"}
 
             except PlaywrightError as e:
-                logger.error(f"Ошибка при загрузке страницы для ИНН {inn}: {str(e)}")
-                return json.dumps({"error": f"Ошибка загрузки страницы: {str(e)}"}, ensure_ascii=False, indent=2)
-            finally:
-                # Сохранение HTML-кода страницы в файл
-                try:
-                    content = await page.content()
-                    with open(html_file, "w", encoding="utf-8") as f:
-                        f.write(content)
-                    logger.info(f"HTML-код страницы сохранен в {html_file}")
-                except Exception as save_error:
-                    logger.error(f"Ошибка при сохранении HTML-кода для ИНН {inn}: {str(save_error)}")
-                await page.close()
-                await browser.close()
-
-        except PlaywrightError as e:
-            logger.error(f"Ошибка подключения к CDP для ИНН {inn}: {str(e)}")
-            return json.dumps({"error": f"Ошибка подключения к браузеру: {str(e)}"}, ensure_ascii=False, indent=2)
-
-    # Парсинг сохраненного HTML-файла
+                logger.error("Ошибка при загрузке страницы для ИНН %s: %s", inn, e)
+                await save_page_debug_html("efrsb", inn, page)
+                return {"error": f"Ошибка загрузки страницы: {str(e)}"}
+
+            # HTML-код страницы разбирается в памяти, на диск - только в отладочном режиме
+            content = await page.content()
+            await save_debug_html("efrsb", inn, content)
+
+    except PlaywrightError as e:
+        logger.error("Ошибка подключения к CDP для ИНН %s: %s", inn, e)
+        return {"error": f"Ошибка подключения к браузеру: {str(e)}"}
+
+    # Разбор HTML-кода страницы в пуле процессов
     try:
-        with open(html_file, "r", encoding="utf-8") as f:
-            content = f.read()
-        soup = BeautifulSoup(content, 'html.parser')
-
-        no_result = soup.find('div', class_='no-result-msg__header')
-        if no_result and not soup.find('div', class_='u-card-result'):
-            logger.info(f"Данные ЕФРСБ для ИНН {inn}: Ничего не найдено")
-            return json.dumps({"legal_entities": [], "individuals": []}, ensure_ascii=False, indent=2)
-
-        result = {"legal_entities": [], "individuals": []}
-        cards = soup.find_all('div', class_='u-card-result')
-        logger.info(f"Найдено карточек для ИНН {inn}: {len(cards)}")
-
-        if not cards:
-            logger.warning(f"Карточки не найдены для ИНН {inn}")
-            return json.dumps({"legal_entities": [], "individuals": []}, ensure_ascii=False, indent=2)
-
-        for card in cards:
-            entry = {}
-            name = card.find('div', class_='u-card-result__name')
-            entry['name' if 'ОГРН' in card.get_text() else 'full_name'] = name.get_text(
-                strip=True) if name else ''
-            address = card.find('div', class_='u-card-result__value_adr')
-            entry['address'] = address.get_text(strip=True) if address else ''
-            inn_elem = card.find('span', class_='u-card-result__point', string='ИНН')
-            if inn_elem:
-                inn_value = inn_elem.find_next('span', class_='u-card-result__value')
-                entry['inn'] = inn_value.get_text(strip=True) if inn_value else ''
-            if 'ОГРН' in card.get_text():
-                ogrn_elem = card.find('span', class_='u-card-result__point', string='ОГРН')
-                if ogrn_elem:
-                    ogrn_value = ogrn_elem.find_next('span', class_='u-card-result__value')
-                    entry['ogrn'] = ogrn_value.get_text(strip=True) if ogrn_value else ''
-                result['legal_entities'].append(entry)
-            else:
-                snils_elem = card.find('span', class_='u-card-result__point', string='СНИЛС')
-                if snils_elem:
-                    snils_value = snils_elem.find_next('span', class_='u-card-result__value')
-                    entry['snils'] = snils_value.get_text(strip=True) if snils_value else ''
-                result['individuals'].append(entry)
-            status = card.find('div', class_='u-card-result__value_item-property')
-            entry['status'] = status.get_text(strip=True) if status else ''
-            status_date = card.find('div', class_='status-date')
-            entry['status_date'] = status_date.get_text(strip=True) if status_date else ''
-            court_case = card.find('div', class_='u-card-result__court-case')
-            if court_case:
-                court_case_value = court_case.find('div', class_='u-card-result__value')
-                entry['court_case_number'] = court_case_value.get_text(strip=True) if court_case_value else ''
-            manager = card.find('div', class_='u-card-result__manager')
-            if manager:
-                manager_value = manager.find('div', class_='u-card-result__value')
-                entry['arbitration_manager'] = manager_value.get_text(strip=True) if manager_value else ''
-
-        logger.info(f"Данные ЕФРСБ для ИНН {inn} успешно получены")
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        with step_timer("efrsb", "html_parse", inn):
+            result = await run_extraction(extract_efrsb, content)
+        if not (result["legal_entities"] or result["individuals"]):
+            # Пустой результат - только при сообщении об отсутствии результатов на странице
+            if NO_RESULTS_MARKER not in content:
+                logger.error("На странице ЕФРСБ для ИНН %s нет ни карточек, ни сообщения об их отсутствии", inn)
+                return {"error": "Неожиданный формат страницы результатов"}
+            logger.info("Данные ЕФРСБ для ИНН %s: Ничего не найдено", inn)
+        else:
+            logger.info(
+                "Данные ЕФРСБ для ИНН %s успешно получены: юрлиц %s, физлиц %s",
+                inn, len(result['legal_entities']), len(result['individuals'])
+            )
+        return result
 
     except Exception as parse_error:
-        logger.error(f"Ошибка при парсинге HTML-файла для ИНН {inn}: {str(parse_error)}")
-        return json.dumps({"error": f"Ошибка парсинга HTML: {str(parse_error)}"}, ensure_ascii=False, indent=2)
-    finally:
-        # Удаление HTML-файла после парсинга
-        try:
-            if os.path.exists(html_file):
-                os.remove(html_file)
-                logger.info(f"HTML-файл {html_file} удален")
-        except Exception as delete_error:
-            logger.error(f"Ошибка при удалении HTML-файла для ИНН {inn}: {str(delete_error)}")
\ No newline at end of file
+        logger.error("Ошибка при парсинге HTML-кода для ИНН %s: %s", inn, parse_error)
+        return {"error": f"Ошибка парсинга HTML: {str(parse_error)}"}
@@ -0,0 +1,181 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .models import Case, Individual, LegalEntity
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_HTML_BACKEND = 'lxml'
+except ImportError:
+    DEFAULT_HTML_BACKEND = 'html.parser'
+
+# Бэкенд BeautifulSoup: lxml заметно быстрее встроенного html.parser
+HTML_BACKEND = os.getenv('PARSER_HTML_BACKEND', DEFAULT_HTML_BACKEND)
+# Число процессов для разбора HTML, 0 - разбор в текущем процессе
+PARSER_PROCESSES = int(os.getenv('PARSER_PROCESSES', 2))
+
+# Строятся только нужные части документа, остальная страница пропускается
+EFRSB_CARDS = SoupStrainer('div', class_='u-card-result')
+KAD_CASES_TABLE = SoupStrainer('table', id='b-cases')
+KAD_ROWS = SoupStrainer('tr')
+
+KAD_NO_RESULTS = re.compile(r'<div[^>]*\sclass="([^"]*\bb-noResults\b[^"]*)"')
+KAD_PAGES_INPUT = re.compile(r'<input[^>]*\sid="documentsPagesCount"[^>]*>')
+INPUT_VALUE = re.compile(r'\svalue="(\d+)"')
+
+_executor = None
+
+
+def _value_after(card, point: str):
+    """Значение поля карточки ЕФРСБ, следующее за подписью point."""
+    point_elem = card.find('span', class_='u-card-result__point', string=point)
+    if not point_elem:
+        return None
+    value = point_elem.find_next('span', class_='u-card-result__value')
+    return value.get_text(strip=True) if value else ''
+
+
+def _parse_efrsb_card(card) -> tuple:
+    """Разбор карточки ЕФРСБ: (раздел результата, Individual или LegalEntity)."""
+    is_legal_entity = 'ОГРН' in card.get_text()
+    if is_legal_entity:
+        entry = LegalEntity(ogrn=_value_after(card, 'ОГРН'))
+    else:
+        entry = Individual(snils=_value_after(card, 'СНИЛС'))
+    name = card.find('div', class_='u-card-result__name')
+    name = name.get_text(strip=True) if name else ''
+    if is_legal_entity:
+        entry.name = name
+    else:
+        entry.full_name = name
+    address = card.find('div', class_='u-card-result__value_adr')
+    entry.address = address.get_text(strip=True) if address else ''
+    entry.inn = _value_after(card, 'ИНН')
+    status = card.find('div', class_='u-card-result__value_item-property')
+    entry.status = status.get_text(strip=True) if status else ''
+    status_date = card.find('div', class_='status-date')
+    entry.status_date = status_date.get_text(strip=True) if status_date else ''
+    court_case = card.find('div', class_='u-card-result__court-case')
+    if court_case:
+        court_case_value = court_case.find('div', class_='u-card-result__value')
+        entry.court_case_number = court_case_value.get_text(strip=True) if court_case_value else ''
+    manager = card.find('div', class_='u-card-result__manager')
+    if manager:
+        manager_value = manager.find('div', class_='u-card-result__value')
+        entry.arbitration_manager = manager_value.get_text(strip=True) if manager_value else ''
+    return ('legal_entities' if is_legal_entity else 'individuals'), entry
+
+
+def extract_efrsb(html: str) -> dict:
+    """Записи о банкротстве со страницы результатов поиска ЕФРСБ."""
+    result = {"legal_entities": [], "individuals": []}
+    soup = BeautifulSoup(html, HTML_BACKEND, parse_only=EFRSB_CARDS)
+    for card in soup.find_all('div', class_='u-card-result'):
+        section, entry = _parse_efrsb_card(card)
+        result[section].append(entry)
+    return result
+
+
+def _side(row, cell_class: str) -> str:
+    """Участник дела из ячейки истца или ответчика; пустая строка, если ячейки нет."""
+    cell = row.find('td', class_=cell_class)
+    side = cell.find('span', class_='js-rollover') if cell else None
+    return side.get_text(strip=True) if side else ''
+
+
+def parse_case_row(row) -> Case:
+    """Разбор строки таблицы результатов kad.arbitr.ru в описание дела.
+
+    Отсутствующие ячейки дают пустые поля; строка без номера дела - ValueError (неожиданный формат).
+    """
+    case = Case()
+    # Номер дела
+    num_case = row.find('a', class_='num_case')
+    if not num_case:
+        raise ValueError("Строка результатов без номера дела")
+    case.case_number = num_case.get_text(strip=True)
+
+    # Дата регистрации
+    date = row.find('div', class_='bankruptcy')
+    date_span = date.find('span') if date else None
+    case.registration_date = date_span.get_text(strip=True) if date_span else ''
+
+    # Судья и инстанция
+    court_cell = row.find('td', class_='court')
+    if court_cell:
+        judge = court_cell.find('div', class_='judge')
+        case.judge = judge.get_text(strip=True) if judge else ''
+        instances = court_cell.find_all('div')
+        # Последний div в td.court
+        case.current_instance = instances[-1].get_text(strip=True) if instances else ''
+
+    # Истец и ответчик
+    case.plaintiff = _side(row, 'plaintiff')
+    case.respondent = _side(row, 'respondent')
+
+    # ИНН (из rolloverHtml)
+    rollover = row.find('span', class_='js-rolloverHtml')
+    if rollover:
+        inn_span = rollover.find('span', class_='g-highlight')
+        case.inn = inn_span.get_text(strip=True) if inn_span else ''
+    return case
+
+
+def _kad_pages_count(html: str):
+    """Число страниц результатов из скрытого поля documentsPagesCount, если оно есть."""
+    pages_input = KAD_PAGES_INPUT.search(html)
+    value = INPUT_VALUE.search(pages_input.group(0)) if pages_input else None
+    return int(value.group(1)) if value else None
+
+
+def extract_kad_cases(html: str) -> dict:
+    """Дела со страницы kad.arbitr.ru после поиска. None в cases - таблица не найдена."""
+    # Блок "ничего не найдено" виден, если у него нет класса g-hidden
+    no_results = KAD_NO_RESULTS.search(html)
+    if no_results and no_results.group(1).split() != ['b-noResults', 'g-hidden']:
+        return {"cases": []}
+    soup = BeautifulSoup(html, HTML_BACKEND, parse_only=KAD_CASES_TABLE)
+    table = soup.find('table', id='b-cases')
+    if not table:
+        return {"cases": None}
+    body = table.find('tbody') or table
+    # Строки без ячеек данных (заголовок таблицы без tbody) пропускаются
+    rows = [row for row in body.find_all('tr') if row.find('td')]
+    return {"cases": [parse_case_row(row) for row in rows], "pages": _kad_pages_count(html)}
+
+
+def extract_kad_fragment(fragment: str) -> dict:
+    """Дела из HTML-фрагмента, который возвращает эндпоинт поиска kad.arbitr.ru."""
+    soup = BeautifulSoup(fragment, HTML_BACKEND, parse_only=KAD_ROWS)
+    rows = [row for row in soup.find_all('tr') if row.find('a', class_='num_case')]
+    # Пустой ответ без счетчика документов - не фрагмент результатов (например, страница защиты)
+    if not rows and 'documentsTotalCount' not in fragment:
+        raise ValueError("Неожиданный формат ответа поиска")
+    return {"cases": [parse_case_row(row) for row in rows], "pages": _kad_pages_count(fragment)}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=PARSER_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+async def run_extraction(func, *args):
+    """Выполнение функции извлечения в пуле процессов, чтобы не блокировать цикл событий."""
+    if PARSER_PROCESSES <= 0:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+def shutdown_extraction_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
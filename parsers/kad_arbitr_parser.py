@@ -1,166 +1,271 @@
 import asyncio
 import logging
-import json
 import os
-from playwright.async_api import async_playwright, Error as PlaywrightError
-from bs4 import BeautifulSoup
-
-# Настройка минимального логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+from contextlib import aclosing
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+from .browser import DEFAULT_CDP_ENDPOINT, get_browser_manager
+from .debug import save_debug_html, save_page_debug_html
+from .extract import extract_kad_cases, extract_kad_fragment, run_extraction
+from .models import dumps
+from .rate_limiter import CaptchaDetected, get_rate_limiter
+from .timing import step_timer
+
 logger = logging.getLogger(__name__)
 
-# Подавление HTTP-логов
-logging.getLogger('httpx').setLevel(logging.WARNING)
+HOST = "kad.arbitr.ru"
+BASE_URL = f"https://{HOST}"
+# XHR, которым страница получает результаты поиска
+SEARCH_ENDPOINT = "/Kad/SearchInstances"
+# Количество дел на странице результатов поиска
+PAGE_SIZE = 25
+# Ограничения постраничной загрузки результатов
+KAD_MAX_PAGES = int(os.getenv('KAD_MAX_PAGES', 10))
+KAD_MAX_CASES = int(os.getenv('KAD_MAX_CASES', 250))
+# Режим получения данных: api - только прямой запрос поиска, dom - только разбор страницы,
+# auto - прямой запрос с переходом на разбор страницы при ошибке. Следующие страницы
+# результатов загружаются только прямым запросом, поэтому при разборе страницы (dom или
+# переход на него в auto) возвращается только первая страница - до PAGE_SIZE дел
+KAD_ARBITR_MODE = os.getenv('KAD_ARBITR_MODE', 'auto')
 
-async def get_info_kad_arbitr(inn: str, cdp_endpoint="http://localhost:9222") -> str:
-    """Получение данных с kad.arbitr.ru через сохранение и парсинг HTML-файла."""
-    url = "https://kad.arbitr.ru/"
-    html_file = f"kad_{inn}.html"
-    async with async_playwright() as p:
-        try:
-            logger.info(f"Подключение к CDP по адресу: {cdp_endpoint}")
-            browser = await p.chromium.connect_over_cdp(cdp_endpoint)
-            page = await browser.contexts[0].new_page()
+# Запрос выполняется из контекста вкладки, поэтому использует ее cookies и анти-бот токены.
+# Эндпоинт возвращает HTML-фрагмент со строками таблицы результатов.
+SEARCH_SCRIPT = """async ({url, body}) => {
+    const response = await fetch(url, {
+        method: 'POST',
+        credentials: 'include',
+        headers: {'Content-Type': 'application/json', 'X-Requested-With': 'XMLHttpRequest'},
+        body: JSON.stringify(body),
+    });
+    return {status: response.status, text: await response.text()};
+}"""
+# Признаки того, что результаты поиска отрисованы
+RESULT_SELECTOR = "table#b-cases tbody tr, div.b-noResults:not(.g-hidden)"
+# Верхние границы ожидания, мс
+PAGE_TIMEOUT = 10000
+RESULT_TIMEOUT = 15000
+RENDER_TIMEOUT = 3000
 
-            try:
-                logger.info(f"Загружаю страницу kad.arbitr.ru")
-                await page.goto(url, wait_until="domcontentloaded", timeout=10000)
-
-                # Проверка полной загрузки: ожидание поля ввода
-                logger.info("Ожидаю поле ввода 'Участник дела'")
-                await page.wait_for_selector("div#sug-participants textarea", timeout=10000)
-                logger.debug("Поле ввода найдено, страница готова к взаимодействию")
-
-                # Проверка и закрытие всплывающего уведомления
-                notification = await page.query_selector("div.b-promo_notification")
-                if notification:
-                    logger.info("Обнаружено всплывающее уведомление, пытаюсь закрыть")
-                    close_button = await page.query_selector("a.b-promo_notification-popup-close")
-                    if close_button:
-                        await close_button.click()
-                        await page.wait_for_timeout(500)
-                        logger.info("Уведомление закрыто")
-                    else:
-                        logger.warning("Кнопка закрытия уведомления не найдена")
-
-                # Проверка на капчу
-                captcha = await page.query_selector("div.b-pravocaptcha")
-                if captcha:
-                    logger.error(f"Обнаружена капча для ИНН {inn}")
-                    return json.dumps({"error": "Обнаружена капча, попробуйте позже"}, ensure_ascii=False, indent=2)
-
-                # Ввод ИНН в поле "Участник дела"
-                logger.info(f"Ввожу ИНН {inn} в поле 'Участник дела'")
-                await page.fill("div#sug-participants textarea", inn)
-                await page.wait_for_timeout(500)  # Короткая пауза после ввода
-
-                # Нажатие кнопки "Найти"
-                logger.info("Нажимаю кнопку 'Найти'")
-                await page.click("div#b-form-submit button")
-
-                # Ожидание загрузки результатов
-                logger.info("Ожидаю результаты поиска")
-                await page.wait_for_timeout(5000)  # Ожидание 5 секунд для рендеринга
-
-            except PlaywrightError as e:
-                logger.error(f"Ошибка при загрузке страницы или взаимодействии для ИНН {inn}: {str(e)}")
-                # Сохраняем HTML для отладки
-                try:
-                    content = await page.content()
-                    with open(html_file, "w", encoding="utf-8") as f:
-                        f.write(content)
-                    logger.info(f"HTML-код страницы сохранен в {html_file} для отладки")
-                except Exception as save_error:
-                    logger.error(f"Ошибка при сохранении HTML-кода: {str(save_error)}")
-                return json.dumps({"error": f"Ошибка загрузки страницы или взаимодействия: {str(e)}"},
-                                 ensure_ascii=False, indent=2)
-            finally:
-                # Сохранение HTML-кода страницы в файл
-                try:
-                    content = await page.content()
-                    with open(html_file, "w", encoding="utf-8") as f:
-                        f.write(content)
-                    logger.info(f"HTML-код страницы сохранен в {html_file}")
-                except Exception as save_error:
-                    logger.error(f"Ошибка при сохранении HTML-кода для ИНН {inn}: {str(save_error)}")
-                await page.close()
-                await browser.close()
-
-        except PlaywrightError as e:
-            logger.error(f"Ошибка подключения к CDP для ИНН {inn}: {str(e)}")
-            return json.dumps({"error": f"Ошибка подключения к браузеру: {str(e)}"}, ensure_ascii=False, indent=2)
-
-    # Парсинг сохраненного HTML-файла
+
+class KadArbitrError(Exception):
+    """Ошибка получения данных, текст которой возвращается пользователю."""
+
+
+class CaptchaError(KadArbitrError, CaptchaDetected):
+    """Сайт потребовал пройти капчу."""
+
+    def __init__(self):
+        super().__init__("Обнаружена капча, попробуйте позже")
+
+
+def _search_body(inn: str, page_number: int = 1) -> dict:
+    return {
+        "Page": page_number,
+        "Count": PAGE_SIZE,
+        "Courts": [],
+        "DateFrom": None,
+        "DateTo": None,
+        "Sides": [{"Name": inn, "Type": -1, "ExactMatch": False}],
+        "Judges": [],
+        "CaseNumbers": [],
+        "WithVKSInstances": False,
+    }
+
+
+async def _search_api(page, inn: str, page_number: int = 1) -> dict:
+    """Поиск прямым запросом к эндпоинту поиска из контекста вкладки браузера."""
+    limiter = get_rate_limiter(HOST)
+    if not page.url.startswith(BASE_URL):
+        # Загрузка сайта нужна, чтобы получить cookies и токены анти-бот защиты
+        with step_timer("kad_arbitr", "page_goto", inn):
+            async with limiter.request():
+                await page.goto(f"{BASE_URL}/", wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+    async with limiter.request():
+        response = await page.evaluate(
+            SEARCH_SCRIPT, {"url": f"{BASE_URL}{SEARCH_ENDPOINT}", "body": _search_body(inn, page_number)}
+        )
+        text = response["text"]
+        if "b-pravocaptcha" in text or (response["status"] != 200 and "captcha" in text.lower()):
+            raise CaptchaError
+        if response["status"] != 200:
+            raise ValueError(f"HTTP {response['status']}")
+        # Ответ не того формата (например, страница анти-бот защиты) тоже снижает темп
+        with step_timer("kad_arbitr", "html_parse", inn):
+            return await run_extraction(extract_kad_fragment, text)
+
+
+async def _search_dom(page, inn: str) -> dict:
+    """Поиск через форму на странице kad.arbitr.ru и разбор первой страницы результатов в памяти."""
+    url = f"{BASE_URL}/"
+    limiter = get_rate_limiter(HOST)
     try:
-        with open(html_file, "r", encoding="utf-8") as f:
-            content = f.read()
-        soup = BeautifulSoup(content, 'html.parser')
-
-        # Проверка на отсутствие результатов
-        no_results = soup.find('div', class_='b-noResults')
-        if no_results and no_results.get('class', []) != ['b-noResults', 'g-hidden']:
-            logger.info(f"Данные для ИНН {inn}: Ничего не найдено")
-            return json.dumps({"cases": []}, ensure_ascii=False, indent=2)
-
-        result = {"cases": []}
-        # Поиск таблицы с результатами
-        table = soup.find('table', id='b-cases')
-        if not table:
-            logger.warning(f"Таблица результатов не найдена для ИНН {inn}")
-            return json.dumps({"cases": []}, ensure_ascii=False, indent=2)
-
-        rows = table.find('tbody').find_all('tr')
-        logger.info(f"Найдено строк в таблице для ИНН {inn}: {len(rows)}")
-
-        for row in rows:
-            case = {}
-            # Номер дела
-            num_case = row.find('a', class_='num_case')
-            case['case_number'] = num_case.get_text(strip=True) if num_case else ''
-
-            # Дата регистрации
-            date = row.find('div', class_='bankruptcy')
-            case['registration_date'] = date.find('span').get_text(strip=True) if date and date.find('span') else ''
-
-            # Судья и инстанция
-            court_cell = row.find('td', class_='court')
-            if court_cell:
-                judge = court_cell.find('div', class_='judge')
-                case['judge'] = judge.get_text(strip=True) if judge else ''
-                instance = court_cell.find_all('div')[-1]  # Последний div в td.court
-                case['current_instance'] = instance.get_text(strip=True) if instance else ''
-
-            # Истец
-            plaintiff = row.find('td', class_='plaintiff').find('span', class_='js-rollover')
-            case['plaintiff'] = plaintiff.get_text(strip=True) if plaintiff else ''
-
-            # Ответчик
-            respondent = row.find('td', class_='respondent').find('span', class_='js-rollover')
-            case['respondent'] = respondent.get_text(strip=True) if respondent else ''
-
-            # ИНН (из rolloverHtml)
-            rollover = row.find('span', class_='js-rolloverHtml')
-            if rollover:
-                inn_span = rollover.find('span', class_='g-highlight')
-                case['inn'] = inn_span.get_text(strip=True) if inn_span else ''
-
-            result['cases'].append(case)
-
-        logger.info(f"Данные для ИНН {inn} успешно получены")
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        logger.info("Загружаю страницу kad.arbitr.ru")
+        with step_timer("kad_arbitr", "page_goto", inn):
+            async with limiter.request():
+                await page.goto(url, wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+
+        # Проверка полной загрузки: ожидание поля ввода
+        logger.info("Ожидаю поле ввода 'Участник дела'")
+        with step_timer("kad_arbitr", "form_wait", inn):
+            await page.wait_for_selector("div#sug-participants textarea", timeout=PAGE_TIMEOUT)
+        logger.debug("Поле ввода найдено, страница готова к взаимодействию")
+
+        # Проверка и закрытие всплывающего уведомления
+        notification = await page.query_selector("div.b-promo_notification")
+        if notification:
+            logger.info("Обнаружено всплывающее уведомление, пытаюсь закрыть")
+            close_button = await page.query_selector("a.b-promo_notification-popup-close")
+            if close_button:
+                await close_button.click()
+                try:
+                    await page.wait_for_selector("div.b-promo_notification", state="hidden", timeout=2000)
+                    logger.info("Уведомление закрыто")
+                except PlaywrightTimeoutError:
+                    logger.warning("Уведомление не скрылось после закрытия")
+            else:
+                logger.warning("Кнопка закрытия уведомления не найдена")
+
+        # Проверка на капчу
+        captcha = await page.query_selector("div.b-pravocaptcha")
+        if captcha:
+            logger.error("Обнаружена капча для ИНН %s", inn)
+            limiter.record_failure("captcha")
+            await save_page_debug_html("kad_arbitr", inn, page)
+            raise CaptchaError
+
+        # Ввод ИНН в поле "Участник дела"
+        logger.info("Ввожу ИНН %s в поле 'Участник дела'", inn)
+        await page.fill("div#sug-participants textarea", inn)
 
+        # Нажатие кнопки "Найти" и ожидание ответа на поисковый XHR
+        logger.info("Нажимаю кнопку 'Найти' и ожидаю результаты поиска")
+        with step_timer("kad_arbitr", "result_wait", inn):
+            try:
+                async with limiter.request():
+                    async with page.expect_response(
+                            lambda response: SEARCH_ENDPOINT in response.url, timeout=RESULT_TIMEOUT):
+                        await page.click("div#b-form-submit button")
+            except PlaywrightTimeoutError as e:
+                # Без ответа на поиск страница не отрисована: это ошибка, а не "ничего не найдено"
+                logger.error("Ответ поиска для ИНН %s не получен за %s мс", inn, RESULT_TIMEOUT)
+                await save_page_debug_html("kad_arbitr", inn, page)
+                raise KadArbitrError(f"Ответ поиска не получен за {RESULT_TIMEOUT} мс") from e
+            # Ожидание отрисовки таблицы или сообщения об отсутствии результатов
+            try:
+                await page.wait_for_selector(RESULT_SELECTOR, timeout=RENDER_TIMEOUT)
+            except PlaywrightTimeoutError as e:
+                logger.error("Результаты поиска для ИНН %s не отрисованы за %s мс", inn, RENDER_TIMEOUT)
+                limiter.record_failure("timeout")
+                await save_page_debug_html("kad_arbitr", inn, page)
+                raise KadArbitrError(f"Результаты поиска не отрисованы за {RENDER_TIMEOUT} мс") from e
+
+    except PlaywrightError as e:
+        logger.error("Ошибка при загрузке страницы или взаимодействии для ИНН %s: %s", inn, e)
+        await save_page_debug_html("kad_arbitr", inn, page)
+        raise KadArbitrError(f"Ошибка загрузки страницы или взаимодействия: {str(e)}") from e
+
+    # HTML-код страницы разбирается в памяти, на диск - только в отладочном режиме
+    content = await page.content()
+    await save_debug_html("kad_arbitr", inn, content)
+
+    # Разбор HTML-кода страницы в пуле процессов
+    try:
+        with step_timer("kad_arbitr", "html_parse", inn):
+            result = await run_extraction(extract_kad_cases, content)
     except Exception as parse_error:
-        logger.error(f"Ошибка при парсинге HTML-файла для ИНН {inn}: {str(parse_error)}")
-        return json.dumps({"error": f"Ошибка парсинга HTML: {str(parse_error)}"}, ensure_ascii=False, indent=2)
-    finally:
-        # Удаление HTML-файла после парсинга
+        logger.error("Ошибка при парсинге HTML-кода для ИНН %s: %s", inn, parse_error)
+        raise KadArbitrError(f"Ошибка парсинга HTML: {str(parse_error)}") from parse_error
+    # Пустой список - только при видимом сообщении об отсутствии результатов
+    if result["cases"] is None:
+        logger.error("Таблица результатов не найдена для ИНН %s", inn)
+        raise KadArbitrError("Таблица результатов не найдена")
+    return result
+
+
+async def _search_first_page(page, inn: str, mode: str) -> tuple:
+    """Первая страница результатов прямым запросом или, при ошибке, через форму на странице.
+
+    Возвращает (результат, получен ли он прямым запросом).
+    """
+    if mode in ("api", "auto"):
         try:
-            if os.path.exists(html_file):
-                os.remove(html_file)
-                logger.info(f"HTML-файл {html_file} удален")
-        except Exception as delete_error:
-            logger.error(f"Ошибка при удалении HTML-файла для ИНН {inn}: {str(delete_error)}")
\ No newline at end of file
+            with step_timer("kad_arbitr", "api_search", inn):
+                return await _search_api(page, inn), True
+        except CaptchaError:
+            logger.error("Обнаружена капча для ИНН %s", inn)
+            raise
+        except (PlaywrightError, ValueError) as e:
+            if mode == "api":
+                logger.error("Ошибка прямого запроса поиска для ИНН %s: %s", inn, e)
+                raise KadArbitrError(f"Ошибка API: {str(e)}") from e
+            logger.warning("Прямой запрос поиска не удался для ИНН %s, перехожу к разбору страницы: %s", inn, e)
+    return await _search_dom(page, inn), False
+
+
+async def iter_kad_arbitr_cases(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT, mode: str = KAD_ARBITR_MODE,
+                                max_pages: int = KAD_MAX_PAGES, max_cases: int = KAD_MAX_CASES):
+    """Постраничная загрузка дел: асинхронный генератор пачек дел по мере получения страниц.
+
+    Каждая пачка - словарь {"cases": [...], "page": номер страницы, "pages": всего страниц или None}.
+    Последующие страницы запрашиваются прямым запросом из той же вкладки, поэтому в памяти
+    держится только одна страница. Если первая страница получена разбором страницы (режим dom
+    или переход на него), прямые запросы недоступны и возвращается только она.
+    Ошибки передаются исключением KadArbitrError.
+    """
+    try:
+        async with get_browser_manager(cdp_endpoint).page("kad_arbitr") as page:
+            result, paged = await _search_first_page(page, inn, mode)
+            if not paged:
+                if result.get("pages") and result["pages"] > 1:
+                    logger.warning("Без прямых запросов загружается только первая из %s страниц для ИНН %s",
+                                   result["pages"], inn)
+                max_pages = 1
+            page_number, sent = 1, 0
+            while True:
+                cases = result["cases"][:max_cases - sent]
+                if cases:
+                    sent += len(cases)
+                    yield {"cases": cases, "page": page_number, "pages": result.get("pages")}
+                last_page = result.get("pages") is not None and page_number >= result["pages"]
+                if last_page or len(result["cases"]) < PAGE_SIZE or page_number >= max_pages or sent >= max_cases:
+                    break
+                page_number += 1
+                try:
+                    with step_timer("kad_arbitr", "api_search", inn):
+                        result = await _search_api(page, inn, page_number)
+                except CaptchaError:
+                    logger.error("Обнаружена капча на странице %s для ИНН %s", page_number, inn)
+                    raise
+                except (PlaywrightError, ValueError) as e:
+                    logger.error("Ошибка загрузки страницы %s для ИНН %s: %s", page_number, inn, e)
+                    raise KadArbitrError(f"Ошибка загрузки страницы {page_number}: {str(e)}") from e
+            logger.info("Данные для ИНН %s успешно получены, дел: %s, страниц: %s", inn, sent, page_number)
+    except PlaywrightError as e:
+        logger.error("Ошибка подключения к CDP для ИНН %s: %s", inn, e)
+        raise KadArbitrError(f"Ошибка подключения к браузеру: {str(e)}") from e
+
+
+async def search_kad_arbitr(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT, mode: str = KAD_ARBITR_MODE,
+                            max_pages: int = KAD_MAX_PAGES, max_cases: int = KAD_MAX_CASES) -> dict:
+    """Получение данных с kad.arbitr.ru со всех страниц результатов в пределах ограничений.
+
+    Возвращает словарь {"cases": [...]} (с ключом "incomplete", если загрузка прервана) или {"error": ...}.
+    """
+    result = {"cases": []}
+    try:
+        async with aclosing(iter_kad_arbitr_cases(inn, cdp_endpoint, mode, max_pages, max_cases)) as batches:
+            async for batch in batches:
+                result["cases"].extend(batch["cases"])
+    except KadArbitrError as e:
+        if not result["cases"]:
+            return {"error": str(e)}
+        # Часть страниц уже получена - возвращаем их с пометкой о неполноте
+        result["incomplete"] = str(e)
+    return result
+
+
+async def get_info_kad_arbitr(inn: str, cdp_endpoint=DEFAULT_CDP_ENDPOINT, mode: str = KAD_ARBITR_MODE,
+                              max_pages: int = KAD_MAX_PAGES, max_cases: int = KAD_MAX_CASES) -> str:
+    """Получение данных с kad.arbitr.ru в виде компактной JSON-строки."""
+    result = await search_kad_arbitr(inn, cdp_endpoint, mode, max_pages, max_cases)
+    return dumps(result).decode("utf-8")
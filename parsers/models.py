@@ -0,0 +1,99 @@
+import json
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Сериализация JSON: orjson заметно быстрее стандартного json
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+class Model:
+    """Общие методы моделей результатов: словарь без пустых необязательных полей и обратно."""
+    __slots__ = ()
+
+    def to_dict(self) -> dict:
+        result = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Модель из словаря ответа сервиса (проверенного validate_items)."""
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class Individual(Model):
+    """Физическое лицо из ЕФРСБ."""
+    full_name: str = ""
+    address: str = ""
+    status: str = ""
+    status_date: str = ""
+    inn: str | None = None
+    snils: str | None = None
+    court_case_number: str | None = None
+    arbitration_manager: str | None = None
+
+
+@dataclass(slots=True)
+class LegalEntity(Model):
+    """Юридическое лицо из ЕФРСБ."""
+    name: str = ""
+    address: str = ""
+    status: str = ""
+    status_date: str = ""
+    inn: str | None = None
+    ogrn: str | None = None
+    court_case_number: str | None = None
+    arbitration_manager: str | None = None
+
+
+@dataclass(slots=True)
+class Case(Model):
+    """Дело Кад.арбитр."""
+    case_number: str = ""
+    registration_date: str = ""
+    plaintiff: str = ""
+    respondent: str = ""
+    judge: str | None = None
+    current_instance: str | None = None
+    inn: str | None = None
+
+
+def validate_items(model: type, items) -> None:
+    """Проверка записей ответа по модели: неизвестное поле или не объект - ValueError."""
+    if not isinstance(items, list):
+        raise ValueError(f"{model.__name__}: ожидался список записей")
+    fields = set(model.__slots__)
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"{model.__name__}: запись не является объектом")
+        unknown = item.keys() - fields
+        if unknown:
+            raise ValueError(f"{model.__name__}: неизвестные поля {', '.join(sorted(unknown))}")
+
+
+def _default(value):
+    if isinstance(value, Model):
+        return value.to_dict()
+    raise TypeError(f"Объект типа {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(data) -> bytes:
+    """Компактный JSON в UTF-8; модели записываются словарями без пустых необязательных полей."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data):
+    """Разбор JSON из строки или байтов."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
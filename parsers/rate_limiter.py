@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Темп запросов к одному сайту, запросов в минуту: начальный и допустимые границы
+RATE_LIMIT_INITIAL = float(os.getenv('RATE_LIMIT_INITIAL', 60))
+RATE_LIMIT_MIN = float(os.getenv('RATE_LIMIT_MIN', 3))
+RATE_LIMIT_MAX = float(os.getenv('RATE_LIMIT_MAX', 240))
+# Сколько запросов можно выполнить подряд без ожидания
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 3))
+# AIMD: прибавка темпа после каждого успешного запроса и множитель при ошибке
+RATE_LIMIT_INCREASE = float(os.getenv('RATE_LIMIT_INCREASE', 1))
+RATE_LIMIT_BACKOFF = float(os.getenv('RATE_LIMIT_BACKOFF', 0.5))
+# Пауза в запросах к сайту после капчи, секунды
+CAPTCHA_COOLDOWN = float(os.getenv('CAPTCHA_COOLDOWN', 60))
+
+
+class CaptchaDetected(Exception):
+    """Сайт ответил капчей: запросы к нему приостанавливаются, темп снижается."""
+
+
+def _failure_kind(error: BaseException) -> str:
+    if isinstance(error, CaptchaDetected):
+        return "captcha"
+    if isinstance(error, (PlaywrightTimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+class AdaptiveRateLimiter:
+    """Ограничитель темпа запросов к одному сайту (token bucket с AIMD-регулировкой).
+
+    Темп растет на RATE_LIMIT_INCREASE после каждого успешного запроса и умножается
+    на RATE_LIMIT_BACKOFF при капче, HTTP-ошибке или тайм-ауте. После капчи запросы
+    к сайту приостанавливаются на CAPTCHA_COOLDOWN секунд.
+    """
+
+    def __init__(self, host: str, rate: float = RATE_LIMIT_INITIAL, min_rate: float = RATE_LIMIT_MIN,
+                 max_rate: float = RATE_LIMIT_MAX, burst: float = RATE_LIMIT_BURST):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.successes = 0
+        self.failures = {"captcha": 0, "timeout": 0, "error": 0}
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    async def acquire(self):
+        """Ожидание разрешения на очередной запрос к сайту."""
+        async with self._lock:
+            while True:
+                pause = self._blocked_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * 60 / self.rate)
+
+    def record_success(self):
+        self.successes += 1
+        self.rate = min(self.max_rate, self.rate + RATE_LIMIT_INCREASE)
+
+    def record_failure(self, kind: str = "error"):
+        """Снижение темпа после капчи ("captcha"), тайм-аута ("timeout") или ошибки ("error")."""
+        self.failures[kind] += 1
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * RATE_LIMIT_BACKOFF)
+        self._tokens = min(self._tokens, 0)
+        if kind == "captcha":
+            self._blocked_until = time.monotonic() + CAPTCHA_COOLDOWN
+            logger.warning(
+                "Капча от %s: запросы приостановлены на %.0f с, темп снижен до %.1f в минуту",
+                self.host, CAPTCHA_COOLDOWN, self.rate
+            )
+        else:
+            logger.warning("Сбой запроса к %s (%s): темп снижен до %.1f в минуту", self.host, kind, self.rate)
+
+    @asynccontextmanager
+    async def request(self):
+        """Запрос к сайту с ожиданием разрешения и учетом результата в темпе."""
+        await self.acquire()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.record_failure(_failure_kind(e))
+            raise
+        self.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host,
+            "rate_per_minute": round(self.rate, 2),
+            "paused_for": round(max(self._blocked_until - time.monotonic(), 0), 1),
+            "successes": self.successes,
+            "failures": dict(self.failures),
+        }
+
+
+_limiters = {}
+
+
+def get_rate_limiter(host: str) -> AdaptiveRateLimiter:
+    """Общий ограничитель темпа для сайта: один на процесс для обоих парсеров."""
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = _limiters[host] = AdaptiveRateLimiter(host)
+    return limiter
+
+
+def rate_limiter_stats() -> list:
+    """Текущий темп и счетчики по всем сайтам."""
+    return [limiter.stats() for limiter in _limiters.values()]
@@ -0,0 +1,29 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Наблюдатели длительности шагов (например, сбор метрик в сервисе): fn(source, step, seconds)
+_step_observers = []
+
+
+def add_step_observer(observer):
+    """Подписка на длительности шагов парсеров."""
+    _step_observers.append(observer)
+
+
+@contextmanager
+def step_timer(source: str, step: str, inn: str = None):
+    """Логирование длительности шага парсера для подбора тайм-аутов.
+
+    Длительности шагов собираются в метриках, поэтому в лог они пишутся на уровне DEBUG.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        logger.debug("[%s] Шаг %s для ИНН %s: %.0f мс", source, step, inn or "-", elapsed * 1000)
+        for observer in _step_observers:
+            observer(source, step, elapsed)
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+from datetime import timedelta
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from metrics import histogram
+from parsers.models import Case, Individual, LegalEntity
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+SEPARATOR = "============================="
+SUBSEPARATOR = "-------------------"
+# Попыток отправки части отчета при тайм-аутах и ограничении частоты Telegram
+SEND_ATTEMPTS = 5
+
+# Длительность этапов обработки запроса; используется и в main.py
+STAGE_SECONDS = histogram(
+    "bot_stage_seconds", "Длительность этапов: ответ сервиса, построение отчета, отправка в Telegram",
+    ("source", "stage")
+)
+
+
+def _value(value) -> str:
+    return "Неизвестно" if value is None else value
+
+
+def header_blocks(inn: str) -> list:
+    return [f"Отчет по должнику (ИНН: {inn})\n{SEPARATOR}", f"\n1. Основные данные\n{SUBSEPARATOR}\n- ИНН: {inn}"]
+
+
+def efrsb_blocks(inn: str, efrsb_data) -> list:
+    """Раздел ЕФРСБ: заголовок и по блоку на каждую запись о банкротстве."""
+    title = f"\n2. ЕФРСБ\n{SUBSEPARATOR}"
+    if not (isinstance(efrsb_data, dict) and efrsb_data.get("status") == "success"):
+        error_msg = efrsb_data.get("error", "Неизвестная ошибка") if isinstance(efrsb_data,
+                                                                                dict) else "Некорректные данные"
+        logger.error("Ошибка в данных ЕФРСБ для ИНН %s: %s", inn, error_msg)
+        return [f"{title}\n- Статус: Ошибка: {error_msg}"]
+    individuals = efrsb_data.get("individuals", [])
+    legal_entities = efrsb_data.get("legal_entities", [])
+    if not (individuals or legal_entities):
+        return [f"{title}\n- Банкротство: Не найдено"]
+    blocks = [f"{title}\n- Банкротство:"]
+    for idx, person in enumerate(map(Individual.from_dict, individuals), 1):
+        blocks.append("\n".join([
+            f"  - Физическое лицо {idx}:",
+            f"    - ФИО: {person.full_name}",
+            f"    - Адрес: {person.address}",
+            f"    - Статус: {person.status}",
+            f"    - Дата статуса: {person.status_date}",
+            f"    - Номер дела: {_value(person.court_case_number)}",
+            f"    - Арбитражный управляющий: {_value(person.arbitration_manager)}",
+        ]))
+    for idx, entity in enumerate(map(LegalEntity.from_dict, legal_entities), 1):
+        blocks.append("\n".join([
+            f"  - Юридическое лицо {idx}:",
+            f"    - Название: {entity.name}",
+            f"    - ИНН: {_value(entity.inn)}",
+            f"    - Статус: {entity.status}",
+            f"    - Дата статуса: {entity.status_date}",
+            f"    - Номер дела: {_value(entity.court_case_number)}",
+            f"    - Арбитражный управляющий: {_value(entity.arbitration_manager)}",
+        ]))
+    return blocks
+
+
+def kad_title_block() -> str:
+    return f"\n3. Кад.арбитр\n{SUBSEPARATOR}"
+
+
+def case_blocks(cases: list, start: int = 1) -> list:
+    """По блоку на каждое дело Кад.арбитр с нумерацией от start."""
+    return ["\n".join([
+        f"  - Дело {idx}:",
+        f"    - Номер дела: {case.case_number}",
+        f"    - Дата регистрации: {case.registration_date}",
+        f"    - Судья: {_value(case.judge)}",
+        f"    - Текущая инстанция: {_value(case.current_instance)}",
+        f"    - Истец: {case.plaintiff}",
+        f"    - Ответчик: {case.respondent}",
+    ]) for idx, case in enumerate(map(Case.from_dict, cases), start)]
+
+
+def kad_result_blocks(inn: str, final_event: dict, shown: int, max_cases: int) -> list:
+    """Завершение раздела Кад.арбитр после получения всех пачек дел."""
+    error_msg = final_event.get("error", "Неизвестная ошибка") if final_event.get("status") != "success" else None
+    if error_msg:
+        logger.error("Ошибка в данных Кад.арбитр для ИНН %s: %s", inn, error_msg)
+    if not shown:
+        return [f"- Статус: Ошибка: {error_msg}" if error_msg else "- Судебные дела: Не найдены"]
+    blocks = [f"- Всего дел: {shown}"]
+    if error_msg:
+        blocks.append(f"- Загрузка прервана: {error_msg}")
+    elif shown >= max_cases:
+        blocks.append(f"- Показаны первые {shown} дел (ограничение KAD_MAX_CASES)")
+    return blocks
+
+
+def closing_block() -> str:
+    return SEPARATOR
+
+
+def split_block(block: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Разбиение слишком длинного блока по строкам (а строки - по limit символов)."""
+    chunks, current = [], ""
+    for line in block.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class MessageRef:
+    """Сообщение Telegram, восстановленное по идентификаторам (для задач из постоянной очереди).
+
+    Поддерживает те же методы reply_text и edit_text, что и telegram.Message.
+    """
+
+    def __init__(self, bot, chat_id: int, message_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def reply_text(self, text: str):
+        message = await self.bot.send_message(self.chat_id, text)
+        return MessageRef(self.bot, self.chat_id, message.message_id)
+
+    async def edit_text(self, text: str):
+        await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+
+
+class ReportRenderer:
+    """Отчет для одного получателя, который дописывается по мере поступления данных.
+
+    Текущее сообщение дописывается редактированием; блок, который не помещается
+    в лимит Telegram, начинает новое сообщение. Блоки (раздел, запись, дело)
+    не разрываются между сообщениями.
+    """
+
+    def __init__(self, message, status_message=None, limit: int = TELEGRAM_MESSAGE_LIMIT):
+        self._reply_to = message
+        self._message = status_message
+        self._limit = limit
+        self._text = ""
+        self._shown = None
+        self._footer = ""
+        # Закрытые сообщения, которые не удалось отправить: (сообщение, текст)
+        self._unsent = []
+        # Постоянная ошибка Telegram (например, чат недоступен): дальнейшие отправки бесполезны
+        self._failed = False
+        self._lock = asyncio.Lock()
+
+    def _with_footer(self, text: str) -> str:
+        return f"{text}\n\n{self._footer}" if self._footer else text
+
+    async def append(self, blocks: list, continuation: str = None, footer: str = None):
+        """Дописывание блоков. continuation - заголовок, которым начинается новое сообщение."""
+        async with self._lock:
+            if footer is not None:
+                self._footer = footer
+            await self._retry_unsent()
+            for block in blocks:
+                candidate = f"{self._text}\n{block}" if self._text else block
+                if len(self._with_footer(candidate)) <= self._limit:
+                    self._text = candidate
+                    continue
+                # Блок не помещается: текущее сообщение закрывается, блок начинает новое
+                if self._text:
+                    await self._close(self._text)
+                    self._text = ""
+                    if continuation:
+                        block = f"{continuation}\n{block}"
+                parts = split_block(block, self._limit - len(self._footer) - 2)
+                for part in parts[:-1]:
+                    await self._close(part)
+                self._text = parts[-1]
+            await self._show(self._with_footer(self._text))
+
+    async def _close(self, text: str):
+        """Окончательный текст текущего сообщения; следующий текст начнет новое сообщение.
+
+        Если отправить текст не удалось, он повторяется при следующем дописывании,
+        поэтому уже принятые блоки не теряются.
+        """
+        if not await self._show(text) and not self._failed:
+            self._unsent.append((self._message, text))
+        self._message, self._shown = None, None
+
+    async def _retry_unsent(self):
+        while self._unsent:
+            message, text = self._unsent[0]
+            message, sent = await self._deliver(message, text)
+            if not sent:
+                return
+            self._unsent.pop(0)
+
+    async def _show(self, text: str) -> bool:
+        """Отображение текста в текущем сообщении (редактированием) или в новом сообщении."""
+        if not text or text == self._shown:
+            return True
+        self._message, sent = await self._deliver(self._message, text)
+        if sent:
+            self._shown = text
+        return sent
+
+    async def _deliver(self, message, text: str) -> tuple:
+        """Отправка с повторами при тайм-аутах и ограничении частоты: (сообщение, отправлено ли).
+
+        Ошибка запроса (BadRequest) не повторяется: после нее отчет больше не отправляется.
+        """
+        if self._failed:
+            return message, False
+        for attempt in range(SEND_ATTEMPTS):
+            try:
+                with STAGE_SECONDS.time(source="telegram", stage="telegram_send"):
+                    return await self._send(message, text), True
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                logger.warning("Ограничение частоты Telegram, повтор через %s с (попытка %s/%s)",
+                               delay, attempt + 1, SEND_ATTEMPTS)
+                await asyncio.sleep(delay)
+            except BadRequest as e:
+                # BadRequest - подкласс NetworkError, но повтор не поможет
+                logger.error("Telegram отклонил отправку отчета: %s", e)
+                self._failed = True
+                self._unsent.clear()
+                return message, False
+            except NetworkError as e:
+                logger.warning("Ошибка сети при отправке отчета (попытка %s/%s): %s", attempt + 1, SEND_ATTEMPTS, e)
+                await asyncio.sleep(2)
+        logger.error("Не удалось отправить часть отчета после %s попыток", SEND_ATTEMPTS)
+        return message, False
+
+    async def _send(self, message, text: str):
+        if message is not None:
+            try:
+                await message.edit_text(text)
+                return message
+            except BadRequest as e:
+                # Текст уже совпадает с показанным - повторная отправка дала бы дубликат
+                if "not modified" in str(e).lower():
+                    return message
+                # Сообщение удалено или недоступно для редактирования - отправляем новое
+                logger.warning("Не удалось отредактировать сообщение отчета: %s", e)
+        return await self._reply_to.reply_text(text)
@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+from contextlib import aclosing
+from aiohttp import web
+
+from logging_setup import REQUEST_ID_HEADER, new_request_id, request_context, setup_logging
+from metrics import counter, gauge, histogram, metrics_handler, REGISTRY
+from parsers import (
+    KadArbitrError,
+    add_step_observer,
+    close_browser_managers,
+    dumps,
+    iter_kad_arbitr_cases,
+    rate_limiter_stats,
+    search_efrsb,
+    search_kad_arbitr,
+    shutdown_extraction_pool,
+)
+from parsers import efrsb_parser, kad_arbitr_parser
+from parsers.browser import BROWSER_MAX_PAGES, DEFAULT_CDP_ENDPOINT
+from parsers.kad_arbitr_parser import KAD_MAX_CASES, KAD_MAX_PAGES
+
+logger = logging.getLogger(__name__)
+
+# Порты сервисов по умолчанию (на них настроен бот)
+SERVICE_PORTS = {"efrsb": 5001, "kad_arbitr": 5002}
+CDP_ENDPOINT = os.getenv('CDP_ENDPOINT', DEFAULT_CDP_ENDPOINT)
+# Сколько поисков одновременно выполняется через один браузер (по всем запросам к сервису)
+SERVICE_MAX_CONCURRENCY = int(os.getenv('SERVICE_MAX_CONCURRENCY', BROWSER_MAX_PAGES))
+# Максимальное число ИНН в одном пакетном запросе
+SERVICE_MAX_BATCH = int(os.getenv('SERVICE_MAX_BATCH', 1000))
+
+INN_PATTERN = re.compile(r'^\d{10}$|^\d{12}$')
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+# Сайт -> источник, для меток метрик
+HOST_SOURCES = {efrsb_parser.HOST: "efrsb", kad_arbitr_parser.HOST: "kad_arbitr"}
+
+REQUESTS = counter("service_requests_total", "Запросы к сервису", ("source", "mode"))
+LOOKUPS_IN_PROGRESS = gauge("service_lookups_in_progress", "Выполняющиеся поиски", ("source",))
+LOOKUP_SECONDS = histogram("service_lookup_seconds", "Длительность поиска по одному ИНН", ("source",))
+PARSER_STEP_SECONDS = histogram(
+    "parser_step_seconds", "Длительность шагов парсеров: подключение к CDP, загрузка страницы, ожидание, разбор",
+    ("source", "step")
+)
+RATE_LIMIT = gauge("parser_rate_limit_per_minute", "Текущий темп запросов к сайту", ("source",))
+SITE_FAILURES = counter("parser_failures_total", "Капчи, тайм-ауты и ошибки запросов к сайту", ("source", "kind"))
+SITE_REQUESTS = counter("parser_site_requests_total", "Успешные запросы к сайту", ("source",))
+
+_browser_limits = {}
+
+
+def browser_slot(cdp_endpoint: str) -> asyncio.Semaphore:
+    """Общее ограничение числа одновременных поисков для браузера."""
+    limit = _browser_limits.get(cdp_endpoint)
+    if limit is None:
+        limit = _browser_limits[cdp_endpoint] = asyncio.Semaphore(SERVICE_MAX_CONCURRENCY)
+    return limit
+
+
+def json_response(data: dict, status: int = 200) -> web.Response:
+    """Компактный JSON-ответ; модели результатов сериализуются без промежуточных словарей."""
+    return web.Response(body=dumps(data), status=status, content_type="application/json", charset="utf-8")
+
+
+def json_error(status: int, message: str) -> web.Response:
+    return json_response({"status": "error", "error": message}, status=status)
+
+
+def json_line(data: dict) -> bytes:
+    return dumps(data) + b"\n"
+
+
+def positive_int(value, default: int) -> int:
+    if value is None:
+        return default
+    value = int(value)
+    if value <= 0:
+        raise ValueError
+    return value
+
+
+async def read_inns(request: web.Request):
+    """Тело запроса и список ИНН: одиночный запрос {"inn": ...} или пакетный {"inns": [...]}."""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Тело запроса должно быть JSON-объектом")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Тело запроса должно быть JSON-объектом")
+    if "inns" in body:
+        inns = body["inns"]
+        if not isinstance(inns, list) or not inns:
+            raise web.HTTPBadRequest(text="Поле inns должно быть непустым списком")
+        if len(inns) > SERVICE_MAX_BATCH:
+            raise web.HTTPBadRequest(text=f"В пакете не более {SERVICE_MAX_BATCH} ИНН")
+        # Повторы в пакете ищутся один раз
+        inns = list(dict.fromkeys(str(inn).strip() for inn in inns))
+    else:
+        inns = [str(body.get("inn", "")).strip()]
+    invalid = [inn for inn in inns if not INN_PATTERN.match(inn)]
+    if invalid:
+        raise web.HTTPBadRequest(text=f"Некорректный ИНН: {invalid[0]}")
+    return body, inns
+
+
+def observe_step(source: str, step: str, seconds: float):
+    PARSER_STEP_SECONDS.observe(seconds, source=source, step=step)
+
+
+async def collect_rate_limits():
+    """Перенос состояния ограничителей темпа в метрики перед выдачей."""
+    for stats in rate_limiter_stats():
+        source = HOST_SOURCES.get(stats["host"], stats["host"])
+        RATE_LIMIT.set(stats["rate_per_minute"], source=source)
+        SITE_REQUESTS.set(stats["successes"], source=source)
+        for kind, count in stats["failures"].items():
+            SITE_FAILURES.set(count, source=source, kind=kind)
+
+
+async def lookup_efrsb(inn: str, options: dict) -> dict:
+    async with browser_slot(options["cdp_endpoint"]):
+        with LOOKUP_SECONDS.time(source="efrsb"):
+            result = await search_efrsb(inn, options["cdp_endpoint"])
+    if "error" in result:
+        return {"status": "error", "error": result["error"]}
+    return {"status": "success", **result}
+
+
+async def lookup_kad_arbitr(inn: str, options: dict) -> dict:
+    async with browser_slot(options["cdp_endpoint"]):
+        with LOOKUP_SECONDS.time(source="kad_arbitr"):
+            result = await search_kad_arbitr(
+                inn, options["cdp_endpoint"], max_pages=options["max_pages"], max_cases=options["max_cases"]
+            )
+    if "error" in result:
+        return {"status": "error", "error": result["error"]}
+    return {"status": "success", "data": result}
+
+
+async def safe_lookup(lookup, inn: str, options: dict) -> dict:
+    source = options["source"]
+    LOOKUPS_IN_PROGRESS.inc(source=source)
+    try:
+        return await lookup(inn, options)
+    except Exception as e:
+        logger.error("Непредвиденная ошибка поиска для ИНН %s: %s", inn, e, exc_info=True)
+        return {"status": "error", "error": f"Внутренняя ошибка сервиса: {str(e)}"}
+    finally:
+        LOOKUPS_IN_PROGRESS.dec(source=source)
+
+
+async def kad_arbitr_events(inn: str, options: dict):
+    """События потокового ответа Кад.арбитр: пачки дел ("partial") и итог ("success" или "error")."""
+    total = 0
+    LOOKUPS_IN_PROGRESS.inc(source="kad_arbitr")
+    try:
+        async with browser_slot(options["cdp_endpoint"]):
+            async with aclosing(iter_kad_arbitr_cases(
+                    inn, options["cdp_endpoint"], max_pages=options["max_pages"], max_cases=options["max_cases"]
+            )) as batches:
+                async for batch in batches:
+                    total += len(batch["cases"])
+                    yield {"status": "partial", **batch}
+    except KadArbitrError as e:
+        yield {"status": "error", "error": str(e)}
+        return
+    except Exception as e:
+        logger.error("Непредвиденная ошибка поиска для ИНН %s: %s", inn, e, exc_info=True)
+        yield {"status": "error", "error": f"Внутренняя ошибка сервиса: {str(e)}"}
+        return
+    finally:
+        LOOKUPS_IN_PROGRESS.dec(source="kad_arbitr")
+    yield {"status": "success", "total": total}
+
+
+async def start_stream(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": f"{NDJSON_CONTENT_TYPE}; charset=utf-8"})
+    await response.prepare(request)
+    return response
+
+
+async def stream_batch(request: web.Request, lookup, inns: list, options: dict) -> web.StreamResponse:
+    """Пакетный поиск: по строке NDJSON на каждый ИНН в порядке готовности результатов."""
+    response = await start_stream(request)
+    logger.info("Пакетный запрос %s: ИНН %s", request.path, len(inns))
+
+    async def run(inn):
+        return {"inn": inn, **await safe_lookup(lookup, inn, options)}
+
+    tasks = [asyncio.create_task(run(inn)) for inn in inns]
+    try:
+        for task in asyncio.as_completed(tasks):
+            await response.write(json_line(await task))
+    finally:
+        # Клиент отключился - оставшиеся поиски не нужны
+        for task in tasks:
+            task.cancel()
+    await response.write_eof()
+    return response
+
+
+def make_handler(source: str, lookup):
+    async def handle(request: web.Request) -> web.StreamResponse:
+        # Идентификатор запроса от бота связывает логи бота и поиска в парсерах
+        with request_context(request.headers.get(REQUEST_ID_HEADER) or new_request_id()):
+            return await handle_lookup(request)
+
+    async def handle_lookup(request: web.Request) -> web.StreamResponse:
+        try:
+            body, inns = await read_inns(request)
+            options = {
+                "source": source,
+                "cdp_endpoint": request.app["cdp_endpoint"],
+                "max_pages": positive_int(body.get("max_pages"), KAD_MAX_PAGES),
+                "max_cases": positive_int(body.get("max_cases"), KAD_MAX_CASES),
+            }
+        except web.HTTPBadRequest as e:
+            return json_error(400, e.text)
+        except (TypeError, ValueError):
+            return json_error(400, "Ограничения max_pages и max_cases должны быть положительными числами")
+
+        if "inns" in body:
+            REQUESTS.inc(source=source, mode="batch")
+            return await stream_batch(request, lookup, inns, options)
+        inn = inns[0]
+        if source == "kad_arbitr" and body.get("stream"):
+            REQUESTS.inc(source=source, mode="stream")
+            response = await start_stream(request)
+            async with aclosing(kad_arbitr_events(inn, options)) as events:
+                async for event in events:
+                    await response.write(json_line(event))
+            await response.write_eof()
+            return response
+        logger.info("Запрос %s для ИНН %s", request.path, inn)
+        REQUESTS.inc(source=source, mode="single")
+        result = await safe_lookup(lookup, inn, options)
+        return json_response(result)
+
+    return handle
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "sources": request.app["sources"]})
+
+
+async def stats(request: web.Request) -> web.Response:
+    """Текущий темп запросов к сайтам и счетчики сбоев."""
+    return web.json_response({"rate_limits": rate_limiter_stats()})
+
+
+async def on_cleanup(app: web.Application):
+    await close_browser_managers()
+    shutdown_extraction_pool()
+
+
+def create_app(sources: list, cdp_endpoint: str = CDP_ENDPOINT) -> web.Application:
+    """HTTP-сервис парсеров: POST /efrsb и/или POST /kad_arbitr."""
+    lookups = {"efrsb": lookup_efrsb, "kad_arbitr": lookup_kad_arbitr}
+    app = web.Application()
+    app["cdp_endpoint"] = cdp_endpoint
+    app["sources"] = sources
+    for source in sources:
+        app.router.add_post(f"/{source}", make_handler(source, lookups[source]))
+    app.router.add_get("/health", health)
+    app.router.add_get("/stats", stats)
+    app.router.add_get("/metrics", metrics_handler)
+    add_step_observer(observe_step)
+    REGISTRY.add_collector(collect_rate_limits)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    """Запуск HTTP-сервиса парсеров."""
+    parser = argparse.ArgumentParser(description="HTTP-сервис парсеров ЕФРСБ и Кад.арбитр")
+    parser.add_argument("source", choices=["efrsb", "kad_arbitr", "all"], help="какой парсер обслуживать")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="порт (по умолчанию 5001 для efrsb, 5002 для kad_arbitr)")
+    parser.add_argument("--cdp-endpoint", default=CDP_ENDPOINT, help="адрес Chrome DevTools Protocol")
+    args = parser.parse_args()
+    setup_logging(os.getenv('LOG_FILE', f"service_{args.source}.log"))
+
+    sources = list(SERVICE_PORTS) if args.source == "all" else [args.source]
+    port = args.port or SERVICE_PORTS[sources[0]]
+    logger.info("Запуск сервиса %s на %s:%s", ', '.join(sources), args.host, port)
+    web.run_app(create_app(sources, args.cdp_endpoint), host=args.host, port=port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore:
+    """Локальная история результатов поиска в нормализованном виде.
+
+    Должники, записи ЕФРСБ о банкротстве и дела Кад.арбитр хранятся с датой
+    появления (first_seen) и датой изменения статуса (status_changed_at), поэтому
+    изменения с момента последней проверки находятся запросом по индексам,
+    без сравнения полных результатов.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS debtors ("
+            " inn TEXT PRIMARY KEY,"
+            " name TEXT,"
+            " first_seen REAL NOT NULL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bankruptcies ("
+            " inn TEXT NOT NULL,"
+            " record_key TEXT NOT NULL,"
+            " section TEXT NOT NULL,"
+            " name TEXT,"
+            " status TEXT,"
+            " status_date TEXT,"
+            " previous_status TEXT,"
+            " court_case_number TEXT,"
+            " arbitration_manager TEXT,"
+            " first_seen REAL NOT NULL,"
+            " status_changed_at REAL NOT NULL,"
+            " PRIMARY KEY (inn, record_key));"
+            "CREATE INDEX IF NOT EXISTS bankruptcies_status_date ON bankruptcies (status_date);"
+            "CREATE INDEX IF NOT EXISTS bankruptcies_changed ON bankruptcies (inn, status_changed_at);"
+            "CREATE TABLE IF NOT EXISTS cases ("
+            " inn TEXT NOT NULL,"
+            " case_number TEXT NOT NULL,"
+            " registration_date TEXT,"
+            " judge TEXT,"
+            " current_instance TEXT,"
+            " plaintiff TEXT,"
+            " respondent TEXT,"
+            " first_seen REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (inn, case_number));"
+            "CREATE INDEX IF NOT EXISTS cases_number ON cases (case_number);"
+            "CREATE INDEX IF NOT EXISTS cases_first_seen ON cases (inn, first_seen);"
+            "CREATE TABLE IF NOT EXISTS watches ("
+            " chat_id INTEGER NOT NULL,"
+            " inn TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_checked REAL,"
+            " next_check_at REAL NOT NULL,"
+            " PRIMARY KEY (chat_id, inn));"
+            "CREATE INDEX IF NOT EXISTS watches_due ON watches (next_check_at);"
+        )
+        self._db.commit()
+
+    async def _call(self, func, *args):
+        def run():
+            with self._db_lock:
+                try:
+                    result = func(*args)
+                    self._db.commit()
+                    return result
+                except BaseException:
+                    self._db.rollback()
+                    raise
+        return await asyncio.to_thread(run)
+
+    def _touch_debtor(self, inn: str, name: str, now: float):
+        self._db.execute(
+            "INSERT INTO debtors (inn, name, first_seen, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (inn) DO UPDATE SET name = COALESCE(excluded.name, name), updated_at = excluded.updated_at",
+            (inn, name, now, now)
+        )
+
+    def _record_efrsb(self, inn: str, data: dict):
+        now = time.time()
+        records = [("individuals", r) for r in data.get("individuals", [])] + \
+                  [("legal_entities", r) for r in data.get("legal_entities", [])]
+        name = None
+        for section, record in records:
+            record_name = record.get("name") or record.get("full_name") or ""
+            if record.get("inn") == inn and record_name:
+                name = record_name
+            key = record.get("court_case_number") or f"{record_name}|{record.get('inn', '')}"
+            status = record.get("status", "")
+            # Статус, который был до изменения, сохраняется для уведомления подписчиков
+            self._db.execute(
+                "INSERT INTO bankruptcies (inn, record_key, section, name, status, status_date, court_case_number,"
+                " arbitration_manager, first_seen, status_changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (inn, record_key) DO UPDATE SET"
+                " previous_status = CASE WHEN status != excluded.status THEN status ELSE previous_status END,"
+                " status_changed_at = CASE WHEN status != excluded.status THEN excluded.status_changed_at"
+                " ELSE status_changed_at END,"
+                " status = excluded.status, status_date = excluded.status_date, name = excluded.name,"
+                " arbitration_manager = excluded.arbitration_manager",
+                (inn, key, section, record_name, status, record.get("status_date", ""),
+                 record.get("court_case_number"), record.get("arbitration_manager"), now, now)
+            )
+        self._touch_debtor(inn, name, now)
+
+    def _record_kad_arbitr(self, inn: str, data: dict):
+        now = time.time()
+        self._db.executemany(
+            "INSERT INTO cases (inn, case_number, registration_date, judge, current_instance, plaintiff, respondent,"
+            " first_seen, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (inn, case_number) DO UPDATE SET"
+            " judge = excluded.judge, current_instance = excluded.current_instance, updated_at = excluded.updated_at",
+            [(inn, case["case_number"], case.get("registration_date"), case.get("judge"),
+              case.get("current_instance"), case.get("plaintiff"), case.get("respondent"), now, now)
+             for case in data.get("data", {}).get("cases", []) if case.get("case_number")]
+        )
+        self._touch_debtor(inn, None, now)
+
+    async def record(self, source: str, inn: str, data: dict):
+        """Сохранение успешного ответа сервиса."""
+        func = self._record_efrsb if source == "efrsb" else self._record_kad_arbitr
+        try:
+            await self._call(func, inn, data)
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи истории для %s/%s: %s", source, inn, e)
+
+    def _changes_since(self, inn: str, since: float) -> dict:
+        new_cases = self._db.execute(
+            "SELECT case_number, registration_date, plaintiff, respondent FROM cases"
+            " WHERE inn = ? AND first_seen > ? ORDER BY registration_date", (inn, since)
+        ).fetchall()
+        bankruptcies = self._db.execute(
+            "SELECT name, status, previous_status, status_date, court_case_number, first_seen > ? FROM bankruptcies"
+            " WHERE inn = ? AND status_changed_at > ?", (since, inn, since)
+        ).fetchall()
+        return {"cases": new_cases, "bankruptcies": bankruptcies}
+
+    async def changes_since(self, inn: str, since: float) -> dict:
+        """Новые дела и изменения статусов ЕФРСБ по ИНН после момента since.
+
+        cases: (номер дела, дата регистрации, истец, ответчик);
+        bankruptcies: (имя, статус, прежний статус, дата статуса, номер дела, новая запись).
+        """
+        return await self._call(self._changes_since, inn, since)
+
+    def _add_watch(self, chat_id: int, user_id: int, inn: str, limit: int) -> bool:
+        count, = self._db.execute("SELECT COUNT(*) FROM watches WHERE chat_id = ?", (chat_id,)).fetchone()
+        if count >= limit:
+            return False
+        now = time.time()
+        self._db.execute(
+            "INSERT OR IGNORE INTO watches (chat_id, inn, user_id, created_at, next_check_at) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, inn, user_id, now, now)
+        )
+        return True
+
+    async def add_watch(self, chat_id: int, user_id: int, inn: str, limit: int) -> bool:
+        """Подписка чата на изменения по ИНН. False, если достигнут лимит подписок."""
+        return await self._call(self._add_watch, chat_id, user_id, inn, limit)
+
+    def _remove_watch(self, chat_id: int, inn: str) -> bool:
+        return self._db.execute("DELETE FROM watches WHERE chat_id = ? AND inn = ?", (chat_id, inn)).rowcount > 0
+
+    async def remove_watch(self, chat_id: int, inn: str) -> bool:
+        return await self._call(self._remove_watch, chat_id, inn)
+
+    def _list_watches(self, chat_id: int) -> list:
+        return self._db.execute(
+            "SELECT inn, last_checked FROM watches WHERE chat_id = ? ORDER BY created_at", (chat_id,)
+        ).fetchall()
+
+    async def list_watches(self, chat_id: int) -> list:
+        """Подписки чата: (ИНН, время последней проверки или None)."""
+        return await self._call(self._list_watches, chat_id)
+
+    def _due_watches(self, limit: int) -> list:
+        return self._db.execute(
+            "SELECT chat_id, inn, last_checked FROM watches WHERE next_check_at <= ? ORDER BY next_check_at LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+
+    async def due_watches(self, limit: int = 50) -> list:
+        """Подписки, которые пора проверить: (chat_id, ИНН, время последней проверки или None)."""
+        return await self._call(self._due_watches, limit)
+
+    def _mark_checked(self, chat_id: int, inn: str, checked_at, next_check_at: float):
+        self._db.execute(
+            "UPDATE watches SET last_checked = COALESCE(?, last_checked), next_check_at = ? WHERE chat_id = ? AND inn = ?",
+            (checked_at, next_check_at, chat_id, inn)
+        )
+
+    async def mark_checked(self, chat_id: int, inn: str, checked_at, next_check_at: float):
+        """Запоминание проверки. checked_at=None - проверка не удалась, база сравнения не меняется."""
+        await self._call(self._mark_checked, chat_id, inn, checked_at, next_check_at)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
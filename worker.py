@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import os
+from telegram import Bot
+
+from logging_setup import setup_logging
+from main import TELEGRAM_TOKEN, WORKERS_COUNT, start_workers, stop_workers, worker_tasks
+
+logger = logging.getLogger(__name__)
+
+
+async def run():
+    """Обработка постоянной очереди запросов без приема сообщений.
+
+    Бот (main.py) принимает запросы и складывает их в очередь, а процессы
+    worker.py выполняют их и отправляют отчеты через Bot API. Число таких
+    процессов не ограничено - все они берут задачи из одной очереди.
+    """
+    async with Bot(TELEGRAM_TOKEN) as bot:
+        await start_workers(bot)
+        try:
+            await asyncio.gather(*worker_tasks)
+        finally:
+            await stop_workers()
+
+
+def main():
+    """Запуск процесса воркеров."""
+    # При нескольких процессах воркеров каждому нужен свой LOG_FILE: ротация общего файла небезопасна
+    setup_logging(os.getenv('LOG_FILE', 'worker.log'))
+    if WORKERS_COUNT <= 0:
+        print("WORKERS_COUNT должен быть больше нуля")
+        exit(1)
+    logger.info("Запуск процесса воркеров...")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Остановка процесса воркеров...")
+
+
+if __name__ == '__main__':
+    main()